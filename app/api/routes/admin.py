@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.database import get_db
+from app.deps import get_admin_user
+from app.schemas import ReconcileReport, WalletDriftRead
+from app.services.reconcile import reconcile_balances
+
+
+router = APIRouter()
+
+
+@router.post("/reconcile-balances", response_model=ReconcileReport)
+def reconcile_wallet_balances(
+    fix: bool = Query(False, description="Corrige los balances con diferencias"),
+    batch_size: int = Query(500, ge=1, le=10000, description="Usuarios por consulta"),
+    db: Session = Depends(get_db),
+    _admin: models.User = Depends(get_admin_user),
+):
+    result = reconcile_balances(db, batch_size=batch_size, fix=fix)
+    return ReconcileReport(
+        users_checked=result.users_checked,
+        wallets_checked=result.wallets_checked,
+        fixed=result.fixed,
+        drifted=[WalletDriftRead(**d._asdict()) for d in result.drifted],
+        without_opening=result.without_opening,
+    )
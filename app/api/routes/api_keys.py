@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 
 from app.db import models
 from app.db.database import get_db
-from app.deps import get_current_user
+from app.deps import get_current_user, invalidate_principal_key
 from app.schemas import APIKeyCreate, APIKeyRead, APIKeyWithSecret
 from app.security import create_api_key
 
@@ -48,5 +48,7 @@ def delete_api_key(
     )
     if not key:
         raise HTTPException(status_code=404, detail="API key no encontrada")
+    key_hash = key.key_hash
     db.delete(key)
     db.commit()
+    invalidate_principal_key(key_hash)
@@ -4,7 +4,12 @@ from sqlalchemy.orm import Session
 
 from app.db.database import get_db
 from app.db import models
-from app.security import verify_password, create_access_token, decode_access_token
+from app.security import (
+    verify_password_pooled,
+    create_access_token,
+    decode_access_token,
+    PasswordHasherBusy,
+)
 from app.schemas import Token, UserRead
 
 
@@ -17,7 +22,17 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     # En este flujo, 'username' es el email
     user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas")
+    try:
+        valid = verify_password_pooled(form_data.password, user.password_hash)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo",
+            headers={"Retry-After": "1"},
+        )
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciales inválidas")
     token = create_access_token(subject=user.id)
     return {"access_token": token, "token_type": "bearer"}
@@ -1,19 +1,33 @@
-from typing import List
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session, selectinload
 
 from app.db import models
 from app.db.database import get_db
-from app.deps import get_current_user
-from app.schemas import BudgetCreate, BudgetRead, BudgetUpdate
+from app.deps import get_current_user, conditional_etag
+from app.schemas import BudgetCreate, BudgetRead, BudgetSummary, BudgetUpdate
+from app.services.budget_progress import budget_limit_amount, budget_summary, compute_budget_spent
+from app.services.data_version import bump_data_version
 
 
 router = APIRouter()
 
 
+_INCLUDE_PATTERN = "^progress$"
+
+
+def _budgets_query(db: Session, user_id: int):
+    # Los límites se cargan en una sola consulta adicional para todos los presupuestos
+    return (
+        db.query(models.Budget)
+        .options(selectinload(models.Budget.limits))
+        .filter(models.Budget.user_id == user_id)
+    )
+
+
 def _budget_to_read(budget: models.Budget) -> BudgetRead:
-    limit_amount = sum(float(limit.limit_amount or 0) for limit in budget.limits)
+    limit_amount = budget_limit_amount(budget)
     return BudgetRead(
         id=budget.id,
         name=budget.name,
@@ -84,39 +98,45 @@ def create_budget(
             )
         )
 
+    bump_data_version(db, current_user.id)
     db.commit()
     db.refresh(budget)
     return _budget_to_read(budget)
 
 
-@router.get("/", response_model=List[BudgetRead])
+def _budgets_to_read(db: Session, user_id: int, budgets: List[models.Budget], include: Optional[str]):
+    if include == "progress":
+        spent = compute_budget_spent(db, user_id, budgets)
+        return [budget_summary(b, spent[b.id]) for b in budgets]
+    return [_budget_to_read(b) for b in budgets]
+
+
+@router.get("/", response_model=List[Union[BudgetSummary, BudgetRead]])
 def list_budgets(
+    include: Optional[str] = Query(
+        None, pattern=_INCLUDE_PATTERN, description="'progress' agrega spent/remaining/progress"
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+    _etag: str = Depends(conditional_etag),
 ):
-    budgets = (
-        db.query(models.Budget)
-        .filter(models.Budget.user_id == current_user.id)
-        .order_by(models.Budget.id)
-        .all()
-    )
-    return [_budget_to_read(b) for b in budgets]
+    budgets = _budgets_query(db, current_user.id).order_by(models.Budget.id).all()
+    return _budgets_to_read(db, current_user.id, budgets, include)
 
 
-@router.get("/{budget_id}", response_model=BudgetRead)
+@router.get("/{budget_id}", response_model=Union[BudgetSummary, BudgetRead])
 def get_budget(
     budget_id: int,
+    include: Optional[str] = Query(
+        None, pattern=_INCLUDE_PATTERN, description="'progress' agrega spent/remaining/progress"
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    budget = (
-        db.query(models.Budget)
-        .filter(models.Budget.user_id == current_user.id, models.Budget.id == budget_id)
-        .first()
-    )
+    budget = _budgets_query(db, current_user.id).filter(models.Budget.id == budget_id).first()
     if not budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
-    return _budget_to_read(budget)
+    return _budgets_to_read(db, current_user.id, [budget], include)[0]
 
 
 @router.put("/{budget_id}", response_model=BudgetRead)
@@ -126,11 +146,7 @@ def update_budget(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    budget = (
-        db.query(models.Budget)
-        .filter(models.Budget.user_id == current_user.id, models.Budget.id == budget_id)
-        .first()
-    )
+    budget = _budgets_query(db, current_user.id).filter(models.Budget.id == budget_id).first()
     if not budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
 
@@ -179,6 +195,7 @@ def update_budget(
         else:
             limit_record.category_id = budget.category_id
 
+    bump_data_version(db, current_user.id)
     db.commit()
     db.refresh(budget)
     return _budget_to_read(budget)
@@ -198,4 +215,5 @@ def delete_budget(
     if not budget:
         raise HTTPException(status_code=404, detail="Presupuesto no encontrado")
     db.delete(budget)
+    bump_data_version(db, current_user.id)
     db.commit()
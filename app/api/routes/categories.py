@@ -5,7 +5,8 @@ from sqlalchemy.orm import Session
 from app.db import models
 from app.db.database import get_db
 from app.schemas import CategoryCreate, CategoryRead
-from app.deps import get_current_user
+from app.deps import get_current_user, conditional_etag
+from app.services.data_version import bump_data_version
 
 
 router = APIRouter()
@@ -23,6 +24,7 @@ def create_category(
         user_id=current_user.id,
     )
     db.add(category)
+    bump_data_version(db, current_user.id)
     db.commit()
     db.refresh(category)
     return category
@@ -33,6 +35,7 @@ def list_categories(
     type: Optional[str] = Query(None, pattern="^(income|expense)$"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+    _etag: str = Depends(conditional_etag),
 ):
     q = db.query(models.Category).filter(models.Category.user_id == current_user.id)
     if type is not None:
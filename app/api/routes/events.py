@@ -0,0 +1,62 @@
+import asyncio
+import json
+import os
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.database import get_db
+from app.deps import get_current_user
+from app.events import get_broker
+
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+
+
+def _format_event(event: dict) -> str:
+    data = json.dumps(event["data"], default=str, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+@router.get("/")
+async def stream_events(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Stream SSE con los cambios del usuario.
+
+    Eventos: transaction.created, wallet.balance_changed, budget.threshold_crossed,
+    import.finished. Cada HEARTBEAT_SECONDS se envía un comentario para mantener
+    viva la conexión a través de proxies.
+    """
+    user_id = current_user.id
+    # La conexión a la base no se usa durante el stream: se devuelve al pool
+    db.close()
+    broker = get_broker()
+    sub = broker.subscribe(user_id)
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield _format_event(event)
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,24 +1,41 @@
 import os
+import shutil
 import tempfile
+from typing import List, Optional
+
 from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Form
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
-from app.db.database import get_db
 from app.db import models
+from app.db.database import get_db
 from app.deps import get_current_user
+from app.schemas import ImportJobRead, StatementProfileCreate, StatementProfileRead
+from app.services.import_jobs import ImportQueueFull, import_jobs
 from app.services.importer import import_external_sqlite
+from app.services.statement_importer import STATEMENT_FORMATS, StatementError, import_statement
 
 
 router = APIRouter()
 
 
-@router.post("/sqlite")
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except Exception:
+        pass
+
+
+@router.post("/sqlite", response_model=ImportJobRead, status_code=status.HTTP_202_ACCEPTED)
 def import_sqlite(
     file: UploadFile = File(...),
     default_currency: str = Form("COP"),
-    db: Session = Depends(get_db),
+    source_id: Optional[str] = Form(None, max_length=128),
     current_user: models.User = Depends(get_current_user),
 ):
+    """Encola la importación y devuelve el job; el avance se consulta en /jobs/{id}.
+
+    Reimportar el mismo archivo (mismo source_id) solo agrega o actualiza lo que cambió.
+    """
     if not file.filename.lower().endswith((".sqlite", ".db")):
         raise HTTPException(status_code=400, detail="El archivo debe ser .sqlite o .db")
 
@@ -34,17 +51,187 @@ def import_sqlite(
     finally:
         file.file.close()
 
+    def run(db, user, job):
+        return import_external_sqlite(
+            temp_path,
+            db,
+            user,
+            default_currency,
+            progress=job.report,
+            should_cancel=job.cancelled,
+            source_id=source_id,
+        )
+
     try:
-        result = import_external_sqlite(temp_path, db, current_user, default_currency)
-        return {
-            "status": "ok",
-            "import": result,
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error al importar: {e}")
+        job = import_jobs.submit(current_user.id, "sqlite", run, cleanup=lambda: _remove_file(temp_path))
+    except ImportQueueFull:
+        _remove_file(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiadas importaciones en curso, intenta de nuevo",
+            headers={"Retry-After": "5"},
+        )
+    return job.snapshot()
+
+
+@router.get("/jobs/{job_id}", response_model=ImportJobRead)
+def get_import_job(
+    job_id: str,
+    current_user: models.User = Depends(get_current_user),
+):
+    job = import_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    return job.snapshot()
+
+
+@router.delete("/jobs/{job_id}", response_model=ImportJobRead, status_code=status.HTTP_202_ACCEPTED)
+def cancel_import_job(
+    job_id: str,
+    current_user: models.User = Depends(get_current_user),
+):
+    """Pide cancelar el job; se detiene al terminar el lote en curso."""
+    job = import_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    job.cancel()
+    return job.snapshot()
+
+
+def _validate_profile(db: Session, user_id: int, payload: StatementProfileCreate) -> None:
+    if payload.format not in STATEMENT_FORMATS:
+        raise HTTPException(status_code=400, detail="Formato no soportado (csv u ofx)")
+    if payload.format == "csv":
+        if not payload.date_column:
+            raise HTTPException(status_code=400, detail="Debe indicar la columna de fecha")
+        if not payload.amount_column and not (payload.debit_column and payload.credit_column):
+            raise HTTPException(
+                status_code=400,
+                detail="Debe indicar la columna de monto o las columnas de débito y crédito",
+            )
+        if len(payload.delimiter) != 1 or payload.decimal_separator not in (".", ","):
+            raise HTTPException(status_code=400, detail="Separador inválido")
+    wallet = (
+        db.query(models.Wallet.id)
+        .filter(models.Wallet.id == payload.wallet_id, models.Wallet.user_id == user_id)
+        .first()
+    )
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Wallet no pertenece al usuario")
+    category_ids = {payload.income_category_id, payload.expense_category_id} | {r.category_id for r in payload.rules}
+    types = dict(
+        db.query(models.Category.id, models.Category.type).filter(
+            models.Category.user_id == user_id, models.Category.id.in_(category_ids)
+        )
+    )
+    if len(types) != len(category_ids):
+        raise HTTPException(status_code=404, detail="Categoria no pertenece al usuario")
+    if types[payload.income_category_id] != "income" or types[payload.expense_category_id] != "expense":
+        raise HTTPException(status_code=400, detail="Las categorías por defecto deben ser de ingreso y de gasto")
+
+
+@router.post("/profiles", response_model=StatementProfileRead, status_code=status.HTTP_201_CREATED)
+def create_statement_profile(
+    payload: StatementProfileCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    _validate_profile(db, current_user.id, payload)
+    profile = models.StatementProfile(
+        **payload.model_dump(exclude={"rules"}),
+        user_id=current_user.id,
+        rules=[models.StatementCategoryRule(match=r.match, category_id=r.category_id) for r in payload.rules],
+    )
+    db.add(profile)
+    db.commit()
+    db.refresh(profile)
+    return profile
+
+
+@router.get("/profiles", response_model=List[StatementProfileRead])
+def list_statement_profiles(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    return (
+        db.query(models.StatementProfile)
+        .options(selectinload(models.StatementProfile.rules))
+        .filter(models.StatementProfile.user_id == current_user.id)
+        .order_by(models.StatementProfile.id)
+        .all()
+    )
+
+
+@router.delete("/profiles/{profile_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_statement_profile(
+    profile_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    profile = (
+        db.query(models.StatementProfile)
+        .filter(models.StatementProfile.id == profile_id, models.StatementProfile.user_id == current_user.id)
+        .first()
+    )
+    if not profile:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    # Sin perfil no hay reimportación: se olvidan los movimientos ya vistos
+    db.query(models.ImportSourceMap).filter(
+        models.ImportSourceMap.user_id == current_user.id,
+        models.ImportSourceMap.source_id == f"statement:{profile.id}",
+    ).delete(synchronize_session=False)
+    db.delete(profile)
+    db.commit()
+
+
+@router.post("/statement", response_model=ImportJobRead, status_code=status.HTTP_202_ACCEPTED)
+def import_bank_statement(
+    file: UploadFile = File(...),
+    profile_id: int = Form(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Encola la importación de un extracto CSV/OFX con un perfil guardado.
+
+    Devuelve el job (avance y contadores en /jobs/{id}). El archivo se procesa
+    por lotes que se confirman por separado; los movimientos ya importados con
+    el mismo perfil se omiten.
+    """
+    exists = (
+        db.query(models.StatementProfile.id)
+        .filter(models.StatementProfile.id == profile_id, models.StatementProfile.user_id == current_user.id)
+        .first()
+    )
+    if not exists:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+
+    # El upload se cierra al terminar la petición: el job lee su propia copia
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename or "")[1]) as tmp:
+            temp_path = tmp.name
+            shutil.copyfileobj(file.file, tmp, 1024 * 1024)
     finally:
-        try:
-            os.remove(temp_path)
-        except Exception:
-            pass
+        file.file.close()
 
+    def run(db, user, job):
+        profile = (
+            db.query(models.StatementProfile)
+            .options(selectinload(models.StatementProfile.rules))
+            .filter(models.StatementProfile.id == profile_id, models.StatementProfile.user_id == user.id)
+            .first()
+        )
+        if not profile:
+            raise StatementError("Perfil no encontrado")
+        with open(temp_path, "rb") as stream:
+            return import_statement(stream, db, user, profile, progress=job.report, should_cancel=job.cancelled)
+
+    try:
+        job = import_jobs.submit(current_user.id, "statement", run, cleanup=lambda: _remove_file(temp_path))
+    except ImportQueueFull:
+        _remove_file(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiadas importaciones en curso, intenta de nuevo",
+            headers={"Retry-After": "5"},
+        )
+    return job.snapshot()
@@ -1,13 +1,25 @@
+import asyncio
 from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import List
-from fastapi import APIRouter, Depends
-from sqlalchemy import func, case
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, case, select
 from sqlalchemy.orm import Session, joinedload
 
+from app.cache import get_response_cache
 from app.db import models
-from app.db.database import get_db
-from app.deps import get_current_user
+from app.db.database import ASYNC_DB_ENABLED, AsyncSessionLocal, get_db
+from app.db.dialect import bucket_start
+from app.services.budget_progress import (
+    budget_spent_statements,
+    budget_summary,
+    collect_budget_spent,
+    compute_budget_spent,
+    covers_whole_months,
+)
+from app.deps import get_current_user, conditional_etag
+from app.services.fx import REPORTING_CURRENCY, fx_rates
 from app.schemas import (
     SummaryResponse,
     BalanceSummary,
@@ -15,145 +27,187 @@ from app.schemas import (
     WalletReadLite,
     BudgetSummary,
     TransactionReadDetail,
+    TimeseriesPoint,
+    TimeseriesResponse,
 )
 
 
 router = APIRouter()
 
+TIMESERIES_MAX_BUCKETS = 1000
+_BUCKET_DAYS = {"day": 1, "week": 7, "month": 28}
+
+
+def _sum_by_type(category_type: str):
+    return func.coalesce(
+        func.sum(
+            case(
+                (models.Category.type == category_type, models.Transaction.amount),
+                else_=0,
+            )
+        ),
+        0,
+    )
+
 
 @router.get("/", response_model=SummaryResponse)
-def get_summary(
+async def get_summary(
+    currency: Optional[str] = Query(
+        None, min_length=3, max_length=3, description="Moneda de reporte (por defecto REPORTING_CURRENCY)"
+    ),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+    _etag: str = Depends(conditional_etag),
 ):
-    wallets: List[models.Wallet] = (
-        db.query(models.Wallet)
-        .filter(models.Wallet.user_id == current_user.id)
-        .order_by(models.Wallet.id)
-        .all()
-    )
-    budgets: List[models.Budget] = (
-        db.query(models.Budget)
-        .options(
-            joinedload(models.Budget.wallet),
-            joinedload(models.Budget.category),
-            joinedload(models.Budget.limits),
-        )
-        .filter(models.Budget.user_id == current_user.id)
-        .order_by(models.Budget.id)
-        .all()
+    # El ETag ya codifica usuario, versión de datos y fecha UTC: sirve como clave
+    cache = get_response_cache()
+    if cache.blocking:
+        body = await run_in_threadpool(cache.get, current_user.id, _etag)
+    else:
+        body = cache.get(current_user.id, _etag)
+    if body is None:
+        currency = (currency or REPORTING_CURRENCY).upper()
+        if ASYNC_DB_ENABLED:
+            summary = await build_summary_async(current_user.id, currency)
+        else:
+            summary = await run_in_threadpool(build_summary, db, current_user, currency)
+        body = summary.model_dump_json().encode("utf-8")
+        if cache.blocking:
+            await run_in_threadpool(cache.set, current_user.id, _etag, body)
+        else:
+            cache.set(current_user.id, _etag, body)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": _etag, "Cache-Control": "private, no-cache"},
     )
 
+
+def _summary_statements(user_id: int) -> dict:
+    """Consultas independientes entre sí del resumen."""
     cutoff_date = datetime.utcnow().date() - timedelta(days=30)
+    return {
+        "wallets": select(models.Wallet).where(models.Wallet.user_id == user_id).order_by(models.Wallet.id),
+        "budgets": (
+            select(models.Budget)
+            .options(
+                joinedload(models.Budget.wallet),
+                joinedload(models.Budget.category),
+                joinedload(models.Budget.limits),
+            )
+            .where(models.Budget.user_id == user_id)
+            .order_by(models.Budget.id)
+        ),
+        # Aggregations for incomes/expenses per wallet in last 30 days
+        "agg_rows": (
+            select(
+                models.Transaction.wallet_id,
+                _sum_by_type("income").label("income"),
+                _sum_by_type("expense").label("expense"),
+            )
+            .join(models.Category, models.Transaction.category)
+            .where(
+                models.Transaction.user_id == user_id,
+                models.Transaction.date.isnot(None),
+                models.Transaction.date >= cutoff_date,
+            )
+            .group_by(models.Transaction.wallet_id)
+        ),
+        # Recent transactions (detailed) - last 5
+        "recent_transactions": (
+            select(models.Transaction)
+            .options(joinedload(models.Transaction.wallet), joinedload(models.Transaction.category))
+            .where(models.Transaction.user_id == user_id)
+            .order_by(models.Transaction.date.desc().nullslast(), models.Transaction.id.desc())
+            .limit(5)
+        ),
+    }
 
-    # Aggregations for incomes/expenses per wallet in last 30 days
-    agg_rows = (
-        db.query(
-            models.Transaction.wallet_id,
-            func.coalesce(
-                func.sum(
-                    case(
-                        (models.Category.type == "income", models.Transaction.amount),
-                        else_=0,
-                    )
-                ),
-                0,
-            ).label("income"),
-            func.coalesce(
-                func.sum(
-                    case(
-                        (models.Category.type == "expense", models.Transaction.amount),
-                        else_=0,
-                    )
-                ),
-                0,
-            ).label("expense"),
-        )
-        .join(models.Category, models.Transaction.category)
-        .filter(
-            models.Transaction.user_id == current_user.id,
-            models.Transaction.date.isnot(None),
-            models.Transaction.date >= cutoff_date,
-        )
-        .group_by(models.Transaction.wallet_id)
-        .all()
+
+def _summary_rows(name: str, result):
+    if name == "agg_rows":
+        return result.all()
+    return result.unique().scalars().all()
+
+
+def build_summary(db: Session, current_user: models.User, currency: str = REPORTING_CURRENCY) -> SummaryResponse:
+    results = {
+        name: _summary_rows(name, db.execute(stmt))
+        for name, stmt in _summary_statements(current_user.id).items()
+    }
+    spent_by_budget = compute_budget_spent(db, current_user.id, results["budgets"])
+    return _assemble_summary(spent_by_budget=spent_by_budget, currency=currency, **results)
+
+
+async def build_summary_async(user_id: int, currency: str = REPORTING_CURRENCY) -> SummaryResponse:
+    """Igual que build_summary, pero cada consulta independiente va en su propia
+    AsyncSession (una conexión cada una) y se ejecutan en paralelo."""
+
+    async def run(name, stmt):
+        async with AsyncSessionLocal() as session:
+            return _summary_rows(name, await session.execute(stmt))
+
+    statements = _summary_statements(user_id)
+    rows = await asyncio.gather(*(run(name, stmt) for name, stmt in statements.items()))
+    results = dict(zip(statements, rows))
+
+    budgets = results["budgets"]
+    spent_rows = []
+    statements = budget_spent_statements(user_id, budgets)
+    if statements:
+        async with AsyncSessionLocal() as session:
+            for stmt in statements:
+                spent_rows.extend((await session.execute(stmt)).all())
+    return _assemble_summary(
+        spent_by_budget=collect_budget_spent(budgets, spent_rows), currency=currency, **results
     )
-    wallet_stats = {row.wallet_id: row for row in agg_rows}
 
-    total_income_30 = sum(float(row.income) for row in agg_rows)
-    total_expense_30 = sum(float(row.expense) for row in agg_rows)
 
+def _assemble_summary(
+    wallets: List[models.Wallet],
+    budgets: List[models.Budget],
+    agg_rows,
+    recent_transactions: List[models.Transaction],
+    spent_by_budget: dict,
+    currency: str,
+) -> SummaryResponse:
+    wallet_stats = {row.wallet_id: row for row in agg_rows}
+    wallet_currency = {wallet.id: (wallet.currency or "UNKNOWN").upper() for wallet in wallets}
+    # Un factor por moneda (tasa vigente hoy) que se aplica a todas las filas
+    factors = fx_rates.factors(wallet_currency.values(), currency, datetime.utcnow().date())
+    unconverted = sorted(c for c, factor in factors.items() if factor is None)
+
+    total_income_30 = 0.0
+    total_expense_30 = 0.0
+    total_balance = 0.0
     currency_totals: dict[str, float] = defaultdict(float)
     wallet_summaries: List[WalletBalanceSummary] = []
     for wallet in wallets:
+        factor = factors[wallet_currency[wallet.id]]
         balance_float = float(wallet.balance or 0)
         currency_totals[wallet.currency or "UNKNOWN"] += balance_float
         stats = wallet_stats.get(wallet.id)
         income_30 = float(stats.income) if stats else 0.0
         expense_30 = float(stats.expense) if stats else 0.0
+        if factor is not None:
+            total_balance += balance_float * factor
+            total_income_30 += income_30 * factor
+            total_expense_30 += expense_30 * factor
         wallet_summaries.append(
             WalletBalanceSummary(
                 wallet=WalletReadLite.model_validate(wallet),
                 balance=balance_float,
+                converted_balance=balance_float * factor if factor is not None else None,
                 income_last_30=income_30,
                 expense_last_30=expense_30,
             )
         )
 
-    total_balance = sum(currency_totals.values())
-
     # Budgets progress
-    budget_summaries: List[BudgetSummary] = []
-    for budget in budgets:
-        spent_query = db.query(func.coalesce(func.sum(models.Transaction.amount), 0))
-        spent_query = spent_query.join(models.Category)
-        spent_query = spent_query.filter(
-            models.Transaction.user_id == current_user.id,
-            models.Category.type == "expense",
-        )
-        if budget.wallet_id:
-            spent_query = spent_query.filter(models.Transaction.wallet_id == budget.wallet_id)
-
-        limit_categories = [limit.category_id for limit in budget.limits]
-        if limit_categories:
-            spent_query = spent_query.filter(models.Transaction.category_id.in_(limit_categories))
-        elif budget.category_id:
-            spent_query = spent_query.filter(models.Transaction.category_id == budget.category_id)
-
-        if budget.period_start:
-            spent_query = spent_query.filter(models.Transaction.date >= budget.period_start)
-        if budget.period_end:
-            spent_query = spent_query.filter(models.Transaction.date <= budget.period_end)
-
-        spent = float(spent_query.scalar() or 0.0)
-        budget_amount = sum(float(limit.limit_amount or 0) for limit in budget.limits)
-        remaining = budget_amount - spent
-        progress = spent / budget_amount if budget_amount else 0.0
-        budget_summaries.append(
-            BudgetSummary(
-                id=budget.id,
-                name=budget.name,
-                limit_amount=budget_amount,
-                period_start=budget.period_start,
-                period_end=budget.period_end,
-                user_id=budget.user_id,
-                wallet_id=budget.wallet_id,
-                category_id=budget.category_id,
-                spent=spent,
-                remaining=remaining,
-                progress=progress,
-            )
-        )
+    budget_summaries: List[BudgetSummary] = [
+        budget_summary(budget, spent_by_budget[budget.id]) for budget in budgets
+    ]
 
-    # Recent transactions (detailed) - last 5
-    recent_transactions: List[models.Transaction] = (
-        db.query(models.Transaction)
-        .options(joinedload(models.Transaction.wallet), joinedload(models.Transaction.category))
-        .filter(models.Transaction.user_id == current_user.id)
-        .order_by(models.Transaction.date.desc().nullslast(), models.Transaction.id.desc())
-        .limit(5)
-        .all()
-    )
     recent_tx_serialized = [TransactionReadDetail.model_validate(tx) for tx in recent_transactions]
 
     return SummaryResponse(
@@ -163,8 +217,81 @@ def get_summary(
             income_last_30=total_income_30,
             expense_last_30=total_expense_30,
             net_last_30=total_income_30 - total_expense_30,
+            reporting_currency=currency,
+            unconverted_currencies=unconverted,
         ),
         wallets=wallet_summaries,
         budgets=budget_summaries,
         recent_transactions=recent_tx_serialized,
     )
+
+
+@router.get("/timeseries", response_model=TimeseriesResponse)
+def get_timeseries(
+    bucket: str = Query("month", pattern="^(day|week|month)$"),
+    date_from: Optional[date] = Query(None, alias="from"),
+    date_to: Optional[date] = Query(None, alias="to"),
+    group_by: Optional[str] = Query(None, pattern="^(wallet|category)$"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+    _etag: str = Depends(conditional_etag),
+):
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or (date_to - timedelta(days=365))
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="'from' debe ser anterior a 'to'")
+    if (date_to - date_from).days // _BUCKET_DAYS[bucket] > TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="Rango demasiado grande para el periodo solicitado")
+
+    # Agregación en la base de datos: solo viaja una fila por periodo (y grupo)
+    if bucket == "month" and covers_whole_months(date_from, date_to):
+        # Meses completos: se lee el rollup mensual en vez de las transacciones
+        r = models.MonthlyRollup
+        bucket_col = r.month
+        group_col = {"wallet": r.wallet_id, "category": r.category_id, None: None}[group_by]
+        columns = [bucket_col.label("bucket")]
+        if group_col is not None:
+            columns.append(group_col.label("group_id"))
+        q = db.query(
+            *columns,
+            func.coalesce(func.sum(r.income), 0).label("income"),
+            func.coalesce(func.sum(r.expense), 0).label("expense"),
+        ).filter(r.user_id == current_user.id, r.month >= date_from, r.month <= date_to)
+    else:
+        bucket_col = bucket_start(db, models.Transaction.date, bucket)
+        group_col = {
+            "wallet": models.Transaction.wallet_id,
+            "category": models.Transaction.category_id,
+            None: None,
+        }[group_by]
+        columns = [bucket_col.label("bucket")]
+        if group_col is not None:
+            columns.append(group_col.label("group_id"))
+        q = (
+            db.query(*columns, _sum_by_type("income").label("income"), _sum_by_type("expense").label("expense"))
+            .join(models.Category, models.Transaction.category)
+            .filter(
+                models.Transaction.user_id == current_user.id,
+                models.Transaction.date >= date_from,
+                models.Transaction.date <= date_to,
+            )
+        )
+    group_cols = [bucket_col] if group_col is None else [bucket_col, group_col]
+    rows = q.group_by(*group_cols).order_by(*group_cols).all()
+
+    points = []
+    for row in rows:
+        income = float(row.income)
+        expense = float(row.expense)
+        points.append(
+            TimeseriesPoint(
+                bucket=row.bucket if isinstance(row.bucket, date) else date.fromisoformat(row.bucket),
+                group_id=row.group_id if group_col is not None else None,
+                income=income,
+                expense=expense,
+                net=income - expense,
+            )
+        )
+    return TimeseriesResponse(
+        bucket=bucket, date_from=date_from, date_to=date_to, group_by=group_by, points=points
+    )
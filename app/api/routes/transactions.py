@@ -1,17 +1,44 @@
-from typing import List, Optional
+import base64
+import csv
+import io
+import json
+from typing import Dict, List, Optional
 from datetime import date
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+from decimal import Decimal
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert, or_, select
 from sqlalchemy.orm import Session
 from sqlalchemy.orm import joinedload
 
 from app.db import models
-from app.db.database import get_db
-from app.schemas import TransactionCreate, TransactionRead, TransactionReadDetail
+from app.db.database import get_db, SessionLocal
+from app.db.search import apply_search
+from app.schemas import (
+    TransactionCreate,
+    TransactionRead,
+    TransactionReadDetail,
+    TransactionBulkItemResult,
+    TransactionBulkResult,
+)
 from app.deps import get_current_user
+from app.services.data_version import bump_data_version
+from app.services.notifications import publish_postings
+from app.services.ledger import (
+    Posting,
+    adjust_wallet_balance,
+    apply_postings,
+    apply_wallet_deltas,
+    signed_amount,
+    to_amount,
+)
 
 
 router = APIRouter()
 
+BULK_MAX_ITEMS = 5000
+EXPORT_BATCH_SIZE = 1000
+
 
 @router.post("/", response_model=TransactionRead, status_code=status.HTTP_201_CREATED)
 def create_transaction(
@@ -19,20 +46,24 @@ def create_transaction(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    # Validaciones básicas
-    wallet = db.query(models.Wallet).filter(
-        models.Wallet.id == payload.wallet_id, models.Wallet.user_id == current_user.id
-    ).first()
-    if not wallet:
-        raise HTTPException(status_code=404, detail="Billetera no existe")
-    category = db.query(models.Category).filter(
+    category = db.query(models.Category.type).filter(
         models.Category.id == payload.category_id, models.Category.user_id == current_user.id
     ).first()
     if not category:
         raise HTTPException(status_code=404, detail="Categoría no existe")
 
+    amount = to_amount(payload.amount)
+    # El UPDATE del balance valida también que la wallet sea del usuario y
+    # corre en la misma transacción que el INSERT
+    new_balance = adjust_wallet_balance(
+        db, payload.wallet_id, signed_amount(category.type, amount), user_id=current_user.id
+    )
+    if new_balance is None:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Billetera no existe")
+
     txn = models.Transaction(
-        amount=payload.amount,
+        amount=amount,
         description=payload.description,
         date=payload.date,
         wallet_id=payload.wallet_id,
@@ -40,89 +71,318 @@ def create_transaction(
         user_id=current_user.id,
     )
     db.add(txn)
-
-    # Actualización sencilla del balance de la wallet
-    # Nota: en un escenario real, conviene manejar transacciones y tipos (ingreso/gasto)
-    if category.type == "expense":
-        wallet.balance = (wallet.balance or 0) - payload.amount
-    else:
-        wallet.balance = (wallet.balance or 0) + payload.amount
-
+    postings = [Posting(payload.wallet_id, payload.category_id, payload.date, category.type, amount)]
+    apply_postings(db, current_user.id, postings)
+    bump_data_version(db, current_user.id)
     db.commit()
     db.refresh(txn)
+    publish_postings(db, current_user.id, [txn.id], postings, {payload.wallet_id: new_balance})
     return txn
 
 
+_ORDER_COLUMNS = {
+    "date": models.Transaction.date,
+    "id": models.Transaction.id,
+    "amount": models.Transaction.amount,
+}
+
+
+def _apply_filters(q, user_id: int, wallet_id, category_id, date_from, date_to):
+    q = q.filter(models.Transaction.user_id == user_id)
+    if wallet_id is not None:
+        q = q.filter(models.Transaction.wallet_id == wallet_id)
+    if category_id is not None:
+        q = q.filter(models.Transaction.category_id == category_id)
+    if date_from is not None:
+        q = q.filter(models.Transaction.date >= date_from)
+    if date_to is not None:
+        q = q.filter(models.Transaction.date <= date_to)
+    return q
+
+
+def _encode_cursor(order_by: str, order_dir: str, txn: models.Transaction) -> str:
+    value = getattr(txn, order_by)
+    if isinstance(value, date):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps({"o": order_by, "d": order_dir, "v": value, "id": txn.id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, order_by: str, order_dir: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if data["o"] != order_by or data["d"] != order_dir:
+            raise ValueError("cursor de otro orden")
+        value = data["v"]
+        if value is not None:
+            value = date.fromisoformat(value) if order_by == "date" else Decimal(str(value))
+        return value, int(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+def _after(column, descending: bool, value):
+    return column < value if descending else column > value
+
+
+def _keyset_rows(db: Session, q, order_by: str, order_dir: str, cursor: str, limit: int):
+    """Devuelve hasta limit filas posteriores al cursor usando solo rangos de índice.
+
+    Las filas sin fecha forman un bloque al inicio o al final según cómo ordene
+    NULL el motor (SQLite: menor que todo; Postgres: mayor que todo), así que se
+    recorren como un segmento aparte en lugar de mezclar condiciones OR.
+    """
+    descending = order_dir == "desc"
+    id_col = models.Transaction.id
+    id_order = id_col.desc() if descending else id_col.asc()
+    value, last_id = _decode_cursor(cursor, order_by, order_dir)
+
+    if order_by == "id":
+        return q.filter(_after(id_col, descending, last_id)).order_by(id_order).limit(limit).all()
+
+    column = _ORDER_COLUMNS[order_by]
+    col_order = column.desc() if descending else column.asc()
+
+    def values_segment(start):
+        seg = q.filter(column.isnot(None))
+        if start is not None:
+            start_value, start_id = start
+            bound = column <= start_value if descending else column >= start_value
+            seg = seg.filter(bound, or_(_after(column, descending, start_value), _after(id_col, descending, start_id)))
+        return seg.order_by(col_order, id_order)
+
+    def nulls_segment(start_id):
+        seg = q.filter(column.is_(None))
+        if start_id is not None:
+            seg = seg.filter(_after(id_col, descending, start_id))
+        return seg.order_by(id_order)
+
+    if order_by != "date":
+        return values_segment((value, last_id)).limit(limit).all()
+
+    nulls_low = db.get_bind().dialect.name != "postgresql"
+    nulls_first = descending != nulls_low
+    if value is None:
+        segments = [nulls_segment(last_id)] + ([values_segment(None)] if nulls_first else [])
+    else:
+        segments = [values_segment((value, last_id))] + ([] if nulls_first else [nulls_segment(None)])
+
+    rows: list = []
+    for seg in segments:
+        rows.extend(seg.limit(limit - len(rows)).all())
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def _paginate(db: Session, q, response: Response, order_by, order_dir, cursor, offset, limit, search=None):
+    if search:
+        # Con búsqueda de texto el orden es por relevancia; se pagina con offset
+        if cursor:
+            raise HTTPException(status_code=400, detail="cursor no está disponible junto con q")
+        return apply_search(db, q, search).offset(offset).limit(limit).all()
+    # Se pide una fila de más para saber si existe una página siguiente
+    if cursor:
+        rows = _keyset_rows(db, q, order_by, order_dir, cursor, limit + 1)
+    else:
+        column = _ORDER_COLUMNS[order_by]
+        id_col = models.Transaction.id
+        if order_dir == "desc":
+            q = q.order_by(column.desc(), id_col.desc())
+        else:
+            q = q.order_by(column.asc(), id_col.asc())
+        rows = q.offset(offset).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(order_by, order_dir, rows[-1])
+    return rows
+
+
+@router.post("/bulk", response_model=TransactionBulkResult)
+def create_transactions_bulk(
+    payload: List[TransactionCreate] = Body(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    if len(payload) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo {BULK_MAX_ITEMS} transacciones por lote")
+    if not payload:
+        return TransactionBulkResult(created=0, failed=0, items=[])
+
+    # Validación de pertenencia en bloque: una consulta por tabla para todo el lote
+    wallet_ids = {item.wallet_id for item in payload}
+    category_ids = {item.category_id for item in payload}
+    owned_wallets = {
+        row.id
+        for row in db.query(models.Wallet.id).filter(
+            models.Wallet.user_id == current_user.id, models.Wallet.id.in_(wallet_ids)
+        )
+    }
+    category_types = {
+        row.id: row.type
+        for row in db.query(models.Category.id, models.Category.type).filter(
+            models.Category.user_id == current_user.id, models.Category.id.in_(category_ids)
+        )
+    }
+
+    results: List[TransactionBulkItemResult] = []
+    rows = []
+    row_indexes = []
+    deltas: Dict[int, Decimal] = {}
+    for index, item in enumerate(payload):
+        if item.wallet_id not in owned_wallets:
+            results.append(TransactionBulkItemResult(index=index, ok=False, error="Billetera no existe"))
+            continue
+        if item.category_id not in category_types:
+            results.append(TransactionBulkItemResult(index=index, ok=False, error="Categoría no existe"))
+            continue
+        amount = to_amount(item.amount)
+        rows.append(
+            {
+                "amount": amount,
+                "description": item.description,
+                "date": item.date,
+                "wallet_id": item.wallet_id,
+                "category_id": item.category_id,
+                "user_id": current_user.id,
+            }
+        )
+        row_indexes.append(index)
+        deltas[item.wallet_id] = deltas.get(item.wallet_id, Decimal("0")) + signed_amount(category_types[item.category_id], amount)
+
+    if rows:
+        new_ids = db.execute(
+            insert(models.Transaction).returning(models.Transaction.id, sort_by_parameter_order=True),
+            rows,
+        ).scalars().all()
+        balances = apply_wallet_deltas(db, deltas)
+        postings = [
+            Posting(r["wallet_id"], r["category_id"], r["date"], category_types[r["category_id"]], r["amount"])
+            for r in rows
+        ]
+        apply_postings(db, current_user.id, postings)
+        bump_data_version(db, current_user.id)
+        db.commit()
+        publish_postings(db, current_user.id, new_ids, postings, balances)
+        for index, new_id in zip(row_indexes, new_ids):
+            results.append(TransactionBulkItemResult(index=index, ok=True, id=new_id))
+
+    results.sort(key=lambda r: r.index)
+    created = len(rows)
+    return TransactionBulkResult(created=created, failed=len(payload) - created, items=results)
+
+
 @router.get("/", response_model=List[TransactionRead])
 def list_transactions(
+    response: Response,
     wallet_id: Optional[int] = Query(None),
     category_id: Optional[int] = Query(None),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor opaco devuelto en X-Next-Cursor; ignora offset"),
+    search: Optional[str] = Query(None, alias="q", max_length=200, description="Texto a buscar en la descripción"),
     order_by: str = Query("date", pattern="^(date|id|amount)$"),
     order_dir: str = Query("desc", pattern="^(asc|desc)$"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    q = db.query(models.Transaction).filter(models.Transaction.user_id == current_user.id)
-    if wallet_id is not None:
-        q = q.filter(models.Transaction.wallet_id == wallet_id)
-    if category_id is not None:
-        q = q.filter(models.Transaction.category_id == category_id)
-    if date_from is not None:
-        q = q.filter(models.Transaction.date >= date_from)
-    if date_to is not None:
-        q = q.filter(models.Transaction.date <= date_to)
-    # Order
-    order_column = {
-        "date": models.Transaction.date,
-        "id": models.Transaction.id,
-        "amount": models.Transaction.amount,
-    }[order_by]
-    if order_dir == "desc":
-        order_column = order_column.desc()
-    q = q.order_by(order_column).offset(offset).limit(limit)
-    return q.all()
+    q = _apply_filters(
+        db.query(models.Transaction), current_user.id, wallet_id, category_id, date_from, date_to
+    )
+    search = search.strip() if search else None
+    return _paginate(db, q, response, order_by, order_dir, cursor, offset, limit, search)
 
 
 @router.get("/detailed", response_model=List[TransactionReadDetail])
 def list_transactions_detailed(
+    response: Response,
     wallet_id: Optional[int] = Query(None),
     category_id: Optional[int] = Query(None),
     date_from: Optional[date] = Query(None),
     date_to: Optional[date] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor opaco devuelto en X-Next-Cursor; ignora offset"),
+    search: Optional[str] = Query(None, alias="q", max_length=200, description="Texto a buscar en la descripción"),
     order_by: str = Query("date", pattern="^(date|id|amount)$"),
     order_dir: str = Query("desc", pattern="^(asc|desc)$"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    q = (
-        db.query(models.Transaction)
-        .options(joinedload(models.Transaction.wallet), joinedload(models.Transaction.category))
-        .filter(models.Transaction.user_id == current_user.id)
+    q = db.query(models.Transaction).options(
+        joinedload(models.Transaction.wallet), joinedload(models.Transaction.category)
     )
-    if wallet_id is not None:
-        q = q.filter(models.Transaction.wallet_id == wallet_id)
-    if category_id is not None:
-        q = q.filter(models.Transaction.category_id == category_id)
-    if date_from is not None:
-        q = q.filter(models.Transaction.date >= date_from)
-    if date_to is not None:
-        q = q.filter(models.Transaction.date <= date_to)
+    q = _apply_filters(q, current_user.id, wallet_id, category_id, date_from, date_to)
+    search = search.strip() if search else None
+    return _paginate(db, q, response, order_by, order_dir, cursor, offset, limit, search)
+
+
+_EXPORT_FIELDS = ["id", "date", "amount", "description", "wallet_id", "category_id"]
+
 
-    order_column = {
-        "date": models.Transaction.date,
-        "id": models.Transaction.id,
-        "amount": models.Transaction.amount,
-    }[order_by]
-    if order_dir == "desc":
-        order_column = order_column.desc()
-    q = q.order_by(order_column).offset(offset).limit(limit)
-    return q.all()
+def _export_chunks(stmt, fmt: str):
+    # Sesión propia: el generador corre después de que la dependencia get_db terminó
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf).writerow(_EXPORT_FIELDS)
+            yield buf.getvalue()
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            buf = io.StringIO()
+            if fmt == "csv":
+                writer = csv.writer(buf)
+                for row in rows:
+                    writer.writerow(
+                        [row.id, row.date.isoformat() if row.date else "", row.amount, row.description or "",
+                         row.wallet_id, row.category_id]
+                    )
+            else:
+                for row in rows:
+                    buf.write(
+                        json.dumps(
+                            {
+                                "id": row.id,
+                                "date": row.date.isoformat() if row.date else None,
+                                "amount": float(row.amount),
+                                "description": row.description,
+                                "wallet_id": row.wallet_id,
+                                "category_id": row.category_id,
+                            },
+                            ensure_ascii=False,
+                        )
+                    )
+                    buf.write("\n")
+            yield buf.getvalue()
+    finally:
+        db.close()
+
+
+@router.get("/export")
+def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    wallet_id: Optional[int] = Query(None),
+    category_id: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    current_user: models.User = Depends(get_current_user),
+):
+    stmt = select(*(getattr(models.Transaction, f) for f in _EXPORT_FIELDS))
+    stmt = _apply_filters(stmt, current_user.id, wallet_id, category_id, date_from, date_to)
+    stmt = stmt.order_by(models.Transaction.date, models.Transaction.id)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"transactions.{format}"
+    return StreamingResponse(
+        _export_chunks(stmt, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
 @router.get("/{transaction_id}", response_model=TransactionRead)
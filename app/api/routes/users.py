@@ -5,8 +5,8 @@ from sqlalchemy.orm import Session
 from app.db import models
 from app.db.database import get_db
 from app.schemas import UserCreate, UserRead, UserUpdate
-from app.security import hash_password
-from app.deps import get_current_user
+from app.security import hash_password_pooled, PasswordHasherBusy
+from app.deps import get_current_user, invalidate_principal_user
 
 
 router = APIRouter()
@@ -17,10 +17,18 @@ def create_user(payload: UserCreate, db: Session = Depends(get_db)):
     existing = db.query(models.User).filter(models.User.email == payload.email).first()
     if existing:
         raise HTTPException(status_code=400, detail="Email ya está registrado")
+    try:
+        password_hash = hash_password_pooled(payload.password)
+    except PasswordHasherBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, intenta de nuevo",
+            headers={"Retry-After": "1"},
+        )
     user = models.User(
         email=payload.email,
         name=payload.name,
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
     )
     db.add(user)
     db.commit()
@@ -51,5 +59,6 @@ def update_current_user(
     for field, value in payload.model_dump(exclude_unset=True).items():
         setattr(current_user, field, value)
     db.commit()
+    invalidate_principal_user(current_user.id)
     db.refresh(current_user)
     return current_user
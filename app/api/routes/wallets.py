@@ -1,11 +1,14 @@
+from datetime import date
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.orm import Session
 
 from app.db import models
 from app.db.database import get_db
-from app.schemas import WalletCreate, WalletRead
-from app.deps import get_current_user
+from app.schemas import WalletBalanceAsOf, WalletCreate, WalletRead
+from app.deps import get_current_user, conditional_etag
+from app.services.data_version import bump_data_version
+from app.services.ledger import balance_as_of, open_wallet_checkpoints
 
 
 router = APIRouter()
@@ -24,6 +27,9 @@ def create_wallet(
         user_id=current_user.id,
     )
     db.add(wallet)
+    db.flush()
+    open_wallet_checkpoints(db, wallet.id, payload.balance)
+    bump_data_version(db, current_user.id)
     db.commit()
     db.refresh(wallet)
     return wallet
@@ -33,6 +39,7 @@ def create_wallet(
 def list_wallets(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user),
+    _etag: str = Depends(conditional_etag),
 ):
     return db.query(models.Wallet).filter(models.Wallet.user_id == current_user.id).all()
 
@@ -49,3 +56,24 @@ def get_wallet(
     if not wallet:
         raise HTTPException(status_code=404, detail="Billetera no encontrada")
     return wallet
+
+
+@router.get("/{wallet_id}/balance", response_model=WalletBalanceAsOf)
+def get_wallet_balance(
+    wallet_id: int,
+    as_of: Optional[date] = Query(None, description="Fecha de corte (incluida); por defecto hoy"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    wallet = db.query(models.Wallet).filter(
+        models.Wallet.id == wallet_id, models.Wallet.user_id == current_user.id
+    ).first()
+    if not wallet:
+        raise HTTPException(status_code=404, detail="Billetera no encontrada")
+    as_of = as_of or date.today()
+    return WalletBalanceAsOf(
+        wallet_id=wallet.id,
+        currency=wallet.currency,
+        as_of=as_of,
+        balance=balance_as_of(db, wallet, as_of),
+    )
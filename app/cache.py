@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """Cache en memoria acotada con expiración (TTL) y desalojo LRU.
+
+    Es segura entre hilos y lleva contadores de aciertos/fallos para poder
+    exponerlos como métricas.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self._clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in doomed:
+                del self._data[k]
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+class MemoryResponseCache:
+    """Respuestas serializadas por usuario en un TTLCache del proceso."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 300.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, user_id: int, key: str) -> Optional[bytes]:
+        return self._cache.get((user_id, key))
+
+    def set(self, user_id: int, key: str, value: bytes) -> None:
+        self._cache.set((user_id, key), value)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._cache.delete_where(lambda k, _value: k[0] == user_id)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class RedisResponseCache:
+    """Respuestas serializadas compartidas entre procesos.
+
+    Recibe cualquier cliente con la interfaz de redis-py (get/set/scan_iter/delete),
+    lo que permite usar un sustituto local en pruebas.
+    """
+
+    # Cada get/set es una ida y vuelta de red: las rutas async lo llaman en el threadpool
+    blocking = True
+
+    def __init__(self, client: Any, ttl: float = 300.0, prefix: str = "resp"):
+        self._client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, user_id: int, key: str) -> str:
+        return f"{self.prefix}:{user_id}:{key}"
+
+    def get(self, user_id: int, key: str) -> Optional[bytes]:
+        value = self._client.get(self._key(user_id, key))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, user_id: int, key: str, value: bytes) -> None:
+        self._client.set(self._key(user_id, key), value, ex=max(1, int(self.ttl)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        doomed = list(self._client.scan_iter(match=f"{self.prefix}:{user_id}:*"))
+        if doomed:
+            self._client.delete(*doomed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "redis",
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+def response_cache_from_env():
+    """Backend según RESPONSE_CACHE_BACKEND: 'memory' (por defecto), 'redis' o 'none'."""
+    backend = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+    ttl = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+    if backend == "redis":
+        import redis  # dependencia opcional
+
+        client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        return RedisResponseCache(client, ttl=ttl)
+    size = 0 if backend == "none" else int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+    return MemoryResponseCache(maxsize=size, ttl=ttl)
+
+
+# Cache de respuestas (resumen del dashboard). La clave incluye la versión de
+# datos del usuario, por lo que una escritura la deja obsoleta aunque no se borre;
+# bump_data_version además borra las entradas del usuario para liberar espacio.
+_response_cache = None
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = response_cache_from_env()
+    return _response_cache
+
+
+def set_response_cache(backend) -> None:
+    """Reemplaza el backend (p. ej. por un sustituto local en pruebas)."""
+    global _response_cache
+    _response_cache = backend
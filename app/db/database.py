@@ -45,6 +45,36 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+# Motor async opcional (DB_ASYNC=1) para rutas que lanzan consultas concurrentes.
+# ASYNC_DATABASE_URL permite fijarlo; si no, se deriva de DATABASE_URL cambiando el driver.
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    backend = scheme.split("+", 1)[0]
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"DB_ASYNC no soportado para {backend}")
+    return f"{_ASYNC_DRIVERS[backend]}://{rest}"
+
+
+ASYNC_DB_ENABLED = os.getenv("DB_ASYNC", "0").strip().lower() in ("1", "true", "yes")
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DB_ENABLED:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def ensure_indexes(metadata) -> None:
+    # create_all no agrega índices nuevos a tablas que ya existen
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
 def get_db() -> Generator:
     db = SessionLocal()
     try:
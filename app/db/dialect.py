@@ -0,0 +1,33 @@
+from sqlalchemy import Date, cast, func, literal_column
+from sqlalchemy.orm import Session
+
+
+def upsert_insert(db: Session, model):
+    """INSERT con soporte de ON CONFLICT para el motor actual, o None si no lo tiene."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(model)
+
+
+def bucket_start(db: Session, column, bucket: str):
+    """Expresión SQL con el inicio del periodo (day|week|month) que contiene column.
+
+    Las semanas empiezan el lunes, igual que date_trunc('week') de Postgres.
+    Los argumentos constantes van como literales para que la expresión del SELECT
+    sea idéntica a la del GROUP BY.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return cast(func.date_trunc(literal_column(f"'{bucket}'"), column), Date)
+    if dialect == "sqlite":
+        if bucket == "day":
+            return func.date(column)
+        if bucket == "week":
+            return func.date(column, literal_column("'weekday 0'"), literal_column("'-6 days'"))
+        return func.strftime(literal_column("'%Y-%m-01'"), column)
+    raise NotImplementedError(f"bucket_start no soportado para {dialect}")
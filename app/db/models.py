@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, Date, Text, Index, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, Numeric, Date, Text, Index, DateTime, BigInteger
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -56,6 +56,11 @@ class Transaction(Base):
 
     __table_args__ = (
         Index("ix_transactions_user_date", "user_id", "date"),
+        # Paginación por cursor ordenada por monto
+        Index("ix_transactions_user_amount", "user_id", "amount", "id"),
+        # Filtros por wallet / categoría con rango u orden por fecha
+        Index("ix_transactions_user_wallet_date", "user_id", "wallet_id", "date", "id"),
+        Index("ix_transactions_user_category_date", "user_id", "category_id", "date", "id"),
     )
 
 
@@ -80,7 +85,7 @@ class Budget(Base):
 class CategoryBudgetLimit(Base):
     __tablename__ = "category_budget_limits"
     id = Column(Integer, primary_key=True)
-    budget_id = Column(Integer, ForeignKey("budgets.id"), nullable=False)
+    budget_id = Column(Integer, ForeignKey("budgets.id"), nullable=False, index=True)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
     limit_amount = Column(Numeric(14, 2), nullable=False)
 
@@ -94,6 +99,115 @@ class APIKey(Base):
     name = Column(String, nullable=False)
     key_hash = Column(String, nullable=False, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
 
     user = relationship("User", back_populates="api_keys")
+
+
+class UserDataVersion(Base):
+    # Versión monotónica de los datos de cada usuario; cualquier escritura la incrementa
+    __tablename__ = "user_data_versions"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class MonthlyRollup(Base):
+    # Totales por (usuario, wallet, categoría, mes); se mantiene en la misma
+    # transacción que cada escritura de transacciones. Ver app/services/ledger.py
+    __tablename__ = "monthly_rollups"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
+    month = Column(Date, primary_key=True)  # primer día del mes
+    income = Column(Numeric(14, 2), nullable=False, default=0)
+    expense = Column(Numeric(14, 2), nullable=False, default=0)
+    income_count = Column(Integer, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_monthly_rollups_user_month", "user_id", "month"),
+    )
+
+
+class WalletBalanceCheckpoint(Base):
+    # Saldo de cierre de cada wallet por mes. La fila con month = OPENING_MONTH
+    # guarda el saldo de apertura y la de UNDATED_MONTH suma las transacciones
+    # sin fecha (ver app/services/ledger.py).
+    __tablename__ = "wallet_balance_checkpoints"
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), primary_key=True)
+    month = Column(Date, primary_key=True)
+    closing_balance = Column(Numeric(14, 2), nullable=False, default=0)
+
+
+class FxRate(Base):
+    # Unidades de `currency` que equivalen a 1 unidad de la moneda pivote (FX_PIVOT)
+    # vigentes desde `date` hasta la siguiente fecha registrada.
+    __tablename__ = "fx_rates"
+    currency = Column(String(3), primary_key=True)
+    date = Column(Date, primary_key=True)
+    units_per_pivot = Column(Numeric(20, 8), nullable=False)
+
+
+class ImportSourceMap(Base):
+    # Fila de origen ya importada -> id local, con el hash de su contenido para
+    # detectar cambios en reimportaciones del mismo archivo.
+    __tablename__ = "import_source_map"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    source_id = Column(String(128), primary_key=True)
+    source_table = Column(String(32), primary_key=True)
+    source_pk = Column(String(128), primary_key=True)
+    local_id = Column(Integer, nullable=False)
+    row_hash = Column(String(40), nullable=False)
+    # Delta aplicado al balance de la wallet (solo transacciones)
+    balance_delta = Column(Numeric(14, 2), nullable=True)
+
+
+class ImportCheckpoint(Base):
+    # Última transacción de origen confirmada de una importación en curso; se
+    # borra al terminar. Si existe, la siguiente importación del mismo origen
+    # continúa desde aquí.
+    __tablename__ = "import_checkpoints"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    source_id = Column(String(128), primary_key=True)
+    last_date_created = Column(BigInteger, nullable=False)
+    last_source_pk = Column(String(128), nullable=False)
+    transactions_done = Column(Integer, nullable=False, default=0)
+
+
+class StatementProfile(Base):
+    # Cómo leer los extractos (CSV/OFX) de un banco: columnas, formato y a qué
+    # wallet y categorías van sus movimientos.
+    __tablename__ = "statement_profiles"
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    format = Column(String(8), nullable=False)  # csv / ofx
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    wallet_id = Column(Integer, ForeignKey("wallets.id"), nullable=False)
+    income_category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    expense_category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+    encoding = Column(String(32), nullable=False, default="utf-8")
+    # Solo CSV
+    delimiter = Column(String(1), nullable=False, default=",")
+    date_column = Column(String, nullable=True)
+    date_format = Column(String(32), nullable=False, default="%Y-%m-%d")
+    amount_column = Column(String, nullable=True)  # monto con signo
+    debit_column = Column(String, nullable=True)  # o débito / crédito por separado
+    credit_column = Column(String, nullable=True)
+    description_column = Column(String, nullable=True)
+    category_column = Column(String, nullable=True)
+    decimal_separator = Column(String(1), nullable=False, default=".")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    rules = relationship("StatementCategoryRule", back_populates="profile", cascade="all, delete-orphan")
+
+
+class StatementCategoryRule(Base):
+    # Si `match` coincide con la categoría del extracto o aparece en la
+    # descripción, el movimiento va a category_id.
+    __tablename__ = "statement_category_rules"
+    id = Column(Integer, primary_key=True)
+    profile_id = Column(Integer, ForeignKey("statement_profiles.id"), nullable=False, index=True)
+    match = Column(String, nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=False)
+
+    profile = relationship("StatementProfile", back_populates="rules")
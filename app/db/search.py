@@ -0,0 +1,101 @@
+from sqlalchemy import Float, Integer, func, literal_column, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+# Búsqueda de texto sobre transactions.description.
+# - SQLite: tabla FTS5 "external content" sincronizada con triggers, de modo que
+#   cualquier INSERT (rutas, importador, scripts, executemany) la mantiene al día.
+# - Postgres: índice GIN sobre la expresión to_tsvector, que el motor mantiene solo.
+# - Otros motores o SQLite sin FTS5: se usa LIKE como respaldo.
+
+FTS_TABLE = "transactions_fts"
+PG_CONFIG = "simple"
+
+_SQLITE_DDL = [
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF description ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+]
+
+_fts_available: dict = {}
+
+
+def _pg_tsvector():
+    # Debe coincidir literalmente con la expresión del índice para que el planner lo use
+    return func.to_tsvector(
+        literal_column(f"'{PG_CONFIG}'::regconfig"),
+        func.coalesce(models.Transaction.description, literal_column("''")),
+    )
+
+
+def ensure_search_index(engine: Engine) -> None:
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        with engine.begin() as conn:
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+            ).first()
+            try:
+                if not exists:
+                    conn.execute(
+                        text(
+                            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                            "description, content='transactions', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+                        )
+                    )
+                    # Indexa las filas que ya existían
+                    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+                for ddl in _SQLITE_DDL:
+                    conn.execute(text(ddl))
+                _fts_available[engine.url] = True
+            except Exception:
+                # SQLite compilado sin FTS5
+                _fts_available[engine.url] = False
+    elif dialect == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_transactions_description_fts ON transactions "
+                    f"USING GIN (to_tsvector('{PG_CONFIG}'::regconfig, coalesce(description, '')))"
+                )
+            )
+
+
+def _fts5_query(raw: str) -> str:
+    # Cada palabra como prefijo entre comillas: evita que el usuario inyecte sintaxis FTS5
+    terms = [t.replace('"', '""') for t in raw.split()]
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def apply_search(db: Session, q, raw: str):
+    """Filtra la consulta por texto y la ordena por relevancia (más relevante primero)."""
+    bind = db.get_bind()
+    dialect = bind.dialect.name
+    if dialect == "sqlite" and _fts_available.get(bind.url, False):
+        match = (
+            text(f"SELECT rowid AS id, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query")
+            .bindparams(fts_query=_fts5_query(raw))
+            .columns(id=Integer, rank=Float)
+            .subquery("fts")
+        )
+        return q.join(match, match.c.id == models.Transaction.id).order_by(
+            match.c.rank, models.Transaction.id.desc()
+        )
+    if dialect == "postgresql":
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{PG_CONFIG}'::regconfig"), raw)
+        tsvector = _pg_tsvector()
+        return q.filter(tsvector.op("@@")(tsquery)).order_by(
+            func.ts_rank(tsvector, tsquery).desc(), models.Transaction.id.desc()
+        )
+    pattern = f"%{raw.strip()}%"
+    return q.filter(models.Transaction.description.ilike(pattern)).order_by(models.Transaction.id.desc())
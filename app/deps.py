@@ -1,14 +1,48 @@
-from fastapi import Depends, HTTPException, status, Header
+import hashlib
+import os
+from datetime import datetime
+
+from fastapi import Depends, HTTPException, status, Header, Request, Response
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, make_transient_to_detached
 
+from app.cache import TTLCache
 from app.db.database import get_db
 from app.db import models
 from app.security import decode_access_token, hash_api_key
+from app.services.data_version import get_data_version
+from app.services.fx import fx_rates
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
 
+# Cache de usuarios autenticados, indexada por hash de API key y por 'sub' del JWT.
+# Guarda una copia de las columnas del usuario (no el objeto ORM) para poder
+# reconstruirlo en la sesión de cada request sin ir a la base de datos.
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PRINCIPAL_CACHE_TTL", "60")),
+)
+
+
+def _snapshot_user(user: models.User) -> dict:
+    return {c.key: getattr(user, c.key) for c in models.User.__mapper__.column_attrs}
+
+
+def _user_from_snapshot(db: Session, snapshot: dict) -> models.User:
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    # load=False adjunta el objeto a la sesión sin emitir un SELECT
+    return db.merge(user, load=False)
+
+
+def invalidate_principal_key(key_hash: str) -> None:
+    principal_cache.delete(("key", key_hash))
+
+
+def invalidate_principal_user(user_id: int) -> None:
+    principal_cache.delete_where(lambda _key, value: value["id"] == user_id)
+
 
 def get_current_user(
     db: Session = Depends(get_db),
@@ -17,10 +51,20 @@ def get_current_user(
 ) -> models.User:
     if api_key:
         key_hash = hash_api_key(api_key)
-        api_key_obj = db.query(models.APIKey).filter(models.APIKey.key_hash == key_hash).first()
-        if not api_key_obj:
+        cache_key = ("key", key_hash)
+        snapshot = principal_cache.get(cache_key)
+        if snapshot is not None:
+            return _user_from_snapshot(db, snapshot)
+        user = (
+            db.query(models.User)
+            .join(models.APIKey, models.APIKey.user_id == models.User.id)
+            .filter(models.APIKey.key_hash == key_hash)
+            .first()
+        )
+        if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API key inválida")
-        return api_key_obj.user
+        principal_cache.set(cache_key, _snapshot_user(user))
+        return user
 
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token requerido")
@@ -29,7 +73,59 @@ def get_current_user(
         user_id = int(payload.get("sub"))
     except Exception:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token inválido")
+    cache_key = ("sub", user_id)
+    snapshot = principal_cache.get(cache_key)
+    if snapshot is not None:
+        return _user_from_snapshot(db, snapshot)
     user = db.query(models.User).get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    principal_cache.set(cache_key, _snapshot_user(user))
     return user
+
+
+# Emails con acceso a las rutas de administración, separados por coma
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+
+def get_admin_user(current_user: models.User = Depends(get_current_user)) -> models.User:
+    if (current_user.email or "").lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Requiere permisos de administrador")
+    return current_user
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Comparación débil: se ignora el prefijo W/
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def conditional_etag(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+) -> str:
+    """ETag basado en la versión de datos del usuario; responde 304 antes de ejecutar la ruta.
+
+    Incluye la fecha (UTC) porque algunas respuestas dependen de ventanas relativas a hoy,
+    y la versión de las tasas de cambio cargadas porque el resumen convierte monedas.
+    """
+    version = get_data_version(db, current_user.id)
+    fx_rates.ensure_fresh()
+    today = datetime.utcnow().date().isoformat()
+    seed = f"{current_user.id}:{version}:{fx_rates.version}:{today}:{request.url.path}?{request.url.query}"
+    etag = f'W/"{hashlib.sha1(seed.encode("utf-8")).hexdigest()[:20]}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        raise NotModified(etag)
+    return etag
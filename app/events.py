@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Set
+
+
+class Subscription:
+    """Cola de eventos de un cliente, ligada al event loop que la creó."""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def _put(self, event: dict) -> None:
+        # Corre dentro del loop; si el cliente no consume, se descartan eventos
+        # (el cliente debe refrescar al ver un hueco en los ids)
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def deliver(self, event: dict) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Loop cerrado: la suscripción se limpia al terminar el stream
+            pass
+
+
+class EventBroker:
+    """Pub/sub en memoria por usuario.
+
+    publish() puede llamarse desde cualquier hilo (las rutas sync corren en el
+    threadpool); la entrega a cada suscriptor se hace con call_soon_threadsafe.
+    El backend decide si el evento se entrega solo en este proceso o pasa por
+    un canal compartido (Redis) que lo reparte a todos los procesos.
+    """
+
+    def __init__(self, backend: Optional["MemoryEventBackend"] = None, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.backend = backend or MemoryEventBackend()
+        self.backend.start(self.dispatch)
+
+    def subscribe(self, user_id: int) -> Subscription:
+        sub = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.user_id]
+
+    def publish(self, user_id: int, event_type: str, data: Any) -> None:
+        self.backend.publish({"user_id": user_id, "type": event_type, "data": data})
+
+    def dispatch(self, message: dict) -> None:
+        with self._lock:
+            subs = list(self._subscribers.get(message["user_id"], ()))
+        if not subs:
+            return
+        event = {"id": next(self._ids), "type": message["type"], "data": message["data"]}
+        for sub in subs:
+            sub.deliver(event)
+
+    def has_subscribers(self, user_id: int) -> bool:
+        """Si vale la pena calcular eventos para el usuario.
+
+        Con un backend compartido los suscriptores pueden estar en otro proceso,
+        así que solo el backend en memoria puede responder que no.
+        """
+        if not self.backend.local_only:
+            return True
+        with self._lock:
+            return bool(self._subscribers.get(user_id))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._subscribers),
+                "subscribers": sum(len(s) for s in self._subscribers.values()),
+                "backend": self.backend.name,
+            }
+
+
+class MemoryEventBackend:
+    name = "memory"
+    local_only = True
+
+    def start(self, dispatch: Callable[[dict], None]) -> None:
+        self._dispatch = dispatch
+
+    def publish(self, message: dict) -> None:
+        self._dispatch(message)
+
+
+class RedisEventBackend:
+    """Reparte los eventos entre procesos con PUBLISH/SUBSCRIBE de Redis.
+
+    Recibe cualquier cliente con la interfaz de redis-py (publish/pubsub).
+    """
+
+    name = "redis"
+    local_only = False
+
+    def __init__(self, client: Any, channel: str = "events"):
+        self._client = client
+        self.channel = channel
+
+    def start(self, dispatch: Callable[[dict], None]) -> None:
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+
+        def listen():
+            for message in pubsub.listen():
+                try:
+                    dispatch(json.loads(message["data"]))
+                except Exception:
+                    continue
+
+        threading.Thread(target=listen, name="events-redis", daemon=True).start()
+
+    def publish(self, message: dict) -> None:
+        self._client.publish(self.channel, json.dumps(message, default=str))
+
+
+def event_backend_from_env():
+    """Backend según EVENTS_BACKEND: 'memory' (por defecto) o 'redis'."""
+    if os.getenv("EVENTS_BACKEND", "memory").lower() == "redis":
+        import redis  # dependencia opcional
+
+        return RedisEventBackend(redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0")))
+    return MemoryEventBackend()
+
+
+_broker: Optional[EventBroker] = None
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        _broker = EventBroker(event_backend_from_env(), queue_size=int(os.getenv("EVENTS_QUEUE_SIZE", "100")))
+    return _broker
+
+
+def set_broker(broker: EventBroker) -> None:
+    """Reemplaza el broker (p. ej. con un backend local en pruebas)."""
+    global _broker
+    _broker = broker
+
+
+def has_subscribers(user_id: int) -> bool:
+    try:
+        return get_broker().has_subscribers(user_id)
+    except Exception:
+        return False
+
+
+def publish_event(user_id: int, event_type: str, data: Any) -> None:
+    """Publica un evento para el usuario. Llamar solo después del commit."""
+    try:
+        get_broker().publish(user_id, event_type, data)
+    except Exception:
+        # Las notificaciones no deben hacer fallar una escritura ya confirmada
+        pass
@@ -82,6 +82,19 @@ class TransactionRead(TransactionBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class TransactionBulkItemResult(BaseModel):
+    index: int
+    ok: bool
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class TransactionBulkResult(BaseModel):
+    created: int
+    failed: int
+    items: List[TransactionBulkItemResult]
+
+
 # Auth
 class Token(BaseModel):
     access_token: str
@@ -156,20 +169,32 @@ class APIKeyWithSecret(APIKeyRead):
 
 # Summaries
 class BalanceSummary(BaseModel):
+    # Totales convertidos a reporting_currency; las monedas sin tasa quedan fuera
+    # y se listan en unconverted_currencies. currency_totals no se convierte.
     total_balance: float
     currency_totals: Dict[str, float]
     income_last_30: float
     expense_last_30: float
     net_last_30: float
+    reporting_currency: Optional[str] = None
+    unconverted_currencies: List[str] = []
 
 
 class WalletBalanceSummary(BaseModel):
     wallet: WalletReadLite
     balance: float
+    converted_balance: Optional[float] = None
     income_last_30: float
     expense_last_30: float
 
 
+class WalletBalanceAsOf(BaseModel):
+    wallet_id: int
+    currency: str | None = None
+    as_of: dt_date
+    balance: float
+
+
 class BudgetSummary(BudgetRead):
     spent: float
     remaining: float
@@ -181,3 +206,87 @@ class SummaryResponse(BaseModel):
     wallets: List[WalletBalanceSummary]
     budgets: Optional[List[BudgetSummary]] = None
     recent_transactions: Optional[List[TransactionReadDetail]] = None
+
+
+class TimeseriesPoint(BaseModel):
+    bucket: dt_date
+    group_id: Optional[int] = None
+    income: float
+    expense: float
+    net: float
+
+
+class TimeseriesResponse(BaseModel):
+    bucket: str
+    date_from: dt_date
+    date_to: dt_date
+    group_by: Optional[str] = None
+    points: List[TimeseriesPoint]
+
+
+class WalletDriftRead(BaseModel):
+    wallet_id: int
+    user_id: int
+    stored: float
+    expected: float
+    drift: float
+
+
+class ReconcileReport(BaseModel):
+    users_checked: int
+    wallets_checked: int
+    fixed: int
+    drifted: List[WalletDriftRead]
+    without_opening: List[int]  # wallets sin apertura registrada: no se comparan ni corrigen
+
+
+class ImportJobRead(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued / running / finished / failed / cancelled
+    progress: Dict[str, int]
+    elapsed_seconds: float
+    rows_per_second: float
+    result: Optional[Dict[str, int]] = None
+    error: Optional[str] = None
+
+
+# Perfiles de extractos bancarios
+class StatementCategoryRuleBase(BaseModel):
+    match: str
+    category_id: int
+
+
+class StatementCategoryRuleRead(StatementCategoryRuleBase):
+    id: int
+    model_config = ConfigDict(from_attributes=True)
+
+
+class StatementProfileBase(BaseModel):
+    name: str
+    format: str  # csv / ofx
+    wallet_id: int
+    income_category_id: int
+    expense_category_id: int
+    encoding: str = "utf-8"
+    # Solo CSV: amount_column (con signo) o debit_column + credit_column
+    delimiter: str = ","
+    date_column: Optional[str] = None
+    date_format: str = "%Y-%m-%d"
+    amount_column: Optional[str] = None
+    debit_column: Optional[str] = None
+    credit_column: Optional[str] = None
+    description_column: Optional[str] = None
+    category_column: Optional[str] = None
+    decimal_separator: str = "."
+
+
+class StatementProfileCreate(StatementProfileBase):
+    rules: List[StatementCategoryRuleBase] = []
+
+
+class StatementProfileRead(StatementProfileBase):
+    id: int
+    user_id: int
+    rules: List[StatementCategoryRuleRead] = []
+    model_config = ConfigDict(from_attributes=True)
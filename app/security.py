@@ -1,6 +1,10 @@
 import os
 import hashlib
 import secrets
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
 from hmac import compare_digest
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Union
@@ -37,6 +41,77 @@ def verify_password(password: str, hashed: str) -> bool:
         return False
 
 
+# Pool de procesos dedicado al hashing de contraseñas.
+# PBKDF2 con 310k iteraciones ocupa la CPU ~100ms; ejecutarlo en el pool de hilos
+# de uvicorn permite que una ráfaga de logins bloquee al resto de endpoints.
+# PASSWORD_HASH_WORKERS=0 desactiva el pool y ejecuta el hash en línea.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(max(1, PASSWORD_HASH_WORKERS) * 4)))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+_hash_pool: Optional[ProcessPoolExecutor] = None
+_hash_pool_lock = threading.Lock()
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_MAX_PENDING)
+
+
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                # 'spawn' evita hacer fork de un proceso con hilos activos
+                _hash_pool = ProcessPoolExecutor(
+                    max_workers=PASSWORD_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _hash_pool
+
+
+def _run_in_hash_pool(fn, *args):
+    if PASSWORD_HASH_WORKERS <= 0:
+        return fn(*args)
+    # Limita las solicitudes en vuelo: si la cola está llena se rechaza de inmediato
+    if not _hash_slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        future = _get_hash_pool().submit(fn, *args)
+    except Exception:
+        _hash_slots.release()
+        raise
+    # El cupo se libera cuando el proceso termina, no cuando el request se rinde
+    future.add_done_callback(lambda _f: _hash_slots.release())
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FuturesTimeoutError:
+        future.cancel()
+        raise PasswordHasherBusy()
+    except BrokenProcessPool:
+        # Un worker murió: se descarta el pool para recrearlo en la siguiente llamada
+        shutdown_hash_pool()
+        raise
+
+
+def hash_password_pooled(password: str) -> str:
+    return _run_in_hash_pool(hash_password, password)
+
+
+def verify_password_pooled(password: str, hashed: str) -> bool:
+    return _run_in_hash_pool(verify_password, password, hashed)
+
+
+def shutdown_hash_pool() -> None:
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is not None:
+            _hash_pool.shutdown(wait=False, cancel_futures=True)
+            _hash_pool = None
+
+
 # JWT settings
 JWT_SECRET = os.getenv("JWT_SECRET", "CHANGE_ME_DEV_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, func, literal, or_, select, union_all
+from sqlalchemy.orm import Session, selectinload
+
+from app.db import models
+from app.schemas import BudgetSummary
+from app.services.ledger import Posting, month_start
+
+
+def covers_whole_months(start: Optional[date], end: Optional[date]) -> bool:
+    """True si [start, end] empieza un día 1 y termina el último día de un mes."""
+    if start is None or end is None or start > end:
+        return False
+    return start.day == 1 and (end + timedelta(days=1)).day == 1
+
+
+def budget_categories(budget: models.Budget) -> list[int]:
+    # Los límites por categoría mandan; si no hay, se usa la categoría del presupuesto
+    limit_categories = [limit.category_id for limit in budget.limits]
+    if limit_categories:
+        return limit_categories
+    if budget.category_id:
+        return [budget.category_id]
+    return []
+
+
+def budget_limit_amount(budget: models.Budget) -> float:
+    return sum(float(limit.limit_amount or 0) for limit in budget.limits)
+
+
+def budget_summary(budget: models.Budget, spent: float) -> BudgetSummary:
+    budget_amount = budget_limit_amount(budget)
+    return BudgetSummary(
+        id=budget.id,
+        name=budget.name,
+        limit_amount=budget_amount,
+        period_start=budget.period_start,
+        period_end=budget.period_end,
+        user_id=budget.user_id,
+        wallet_id=budget.wallet_id,
+        category_id=budget.category_id,
+        spent=spent,
+        remaining=budget_amount - spent,
+        progress=spent / budget_amount if budget_amount else 0.0,
+    )
+
+
+# Sin filtro de wallet/categoría se usa 0 (los ids empiezan en 1) y los límites de
+# periodo ausentes son fechas centinela: así ninguna columna del ámbito es NULL,
+# cada motor infiere su tipo sin CASTs y el join es un rango simple sobre
+# ix_transactions_user_date.
+_ANY = 0
+_NO_FROM = date.min
+_NO_TO = date.max
+
+
+def _scope(rows: list[dict], name: str):
+    """Tabla derivada (UNION ALL de SELECTs literales) con una fila por presupuesto y categoría."""
+    selects = [select(*(literal(value).label(key) for key, value in row.items())) for row in rows]
+    return union_all(*selects).subquery(name) if len(selects) > 1 else selects[0].subquery(name)
+
+
+def _scope_rows(budget: models.Budget) -> list[dict]:
+    categories = sorted(set(budget_categories(budget))) or [_ANY]
+    return [
+        {
+            "budget_id": budget.id,
+            "category_id": category_id,
+            "wallet_id": budget.wallet_id or _ANY,
+            "date_from": budget.period_start or _NO_FROM,
+            "date_to": budget.period_end or _NO_TO,
+        }
+        for category_id in categories
+    ]
+
+
+def _matches(scope, category_col, wallet_col):
+    return and_(
+        or_(scope.c.category_id == _ANY, category_col == scope.c.category_id),
+        or_(scope.c.wallet_id == _ANY, wallet_col == scope.c.wallet_id),
+    )
+
+
+# SQLite admite como máximo 500 SELECTs en un compuesto; cada fila del ámbito es uno
+SCOPE_ROWS_PER_STATEMENT = 400
+
+
+def budget_spent_statements(user_id: int, budgets: Iterable[models.Budget]) -> list:
+    """SELECTs (budget_id, spent) que cubren todos los presupuestos; normalmente uno.
+
+    Los presupuestos de meses completos suman monthly_rollups; el resto suma las
+    transacciones de su rango, y los que no tienen ningún límite de periodo
+    suman además las transacciones sin fecha en una rama aparte. Con muchos
+    presupuestos el ámbito se reparte en varias sentencias de hasta
+    SCOPE_ROWS_PER_STATEMENT filas por rama; un presupuesto puede quedar en dos
+    y collect_budget_spent suma sus filas.
+    """
+    rollup_rows: list[dict] = []
+    raw_rows: list[dict] = []
+    undated_rows: list[dict] = []
+    for budget in budgets:
+        rows = _scope_rows(budget)
+        if covers_whole_months(budget.period_start, budget.period_end):
+            for row in rows:
+                row["date_to"] = month_start(budget.period_end)
+            rollup_rows.extend(rows)
+        else:
+            raw_rows.extend(rows)
+            if budget.period_start is None and budget.period_end is None:
+                undated_rows.extend(rows)
+
+    size = SCOPE_ROWS_PER_STATEMENT
+    return [
+        _spent_statement(user_id, rollup_rows[i : i + size], raw_rows[i : i + size], undated_rows[i : i + size])
+        for i in range(0, max(len(rollup_rows), len(raw_rows)), size)
+    ]
+
+
+def _raw_spent(user_id: int, rows: list[dict], name: str, in_period):
+    t = models.Transaction
+    scope = _scope(rows, name)
+    return (
+        select(scope.c.budget_id, func.sum(t.amount).label("spent"))
+        .select_from(scope)
+        .join(t, and_(t.user_id == user_id, _matches(scope, t.category_id, t.wallet_id), in_period(scope, t)))
+        .join(models.Category, and_(models.Category.id == t.category_id, models.Category.type == "expense"))
+        .group_by(scope.c.budget_id)
+    )
+
+
+def _spent_statement(user_id: int, rollup_rows: list[dict], raw_rows: list[dict], undated_rows: list[dict]):
+    parts = []
+    if rollup_rows:
+        r = models.MonthlyRollup
+        scope = _scope(rollup_rows, "rollup_scope")
+        parts.append(
+            select(scope.c.budget_id, func.sum(r.expense).label("spent"))
+            .select_from(scope)
+            .join(
+                r,
+                and_(
+                    r.user_id == user_id,
+                    _matches(scope, r.category_id, r.wallet_id),
+                    r.month >= scope.c.date_from,
+                    r.month <= scope.c.date_to,
+                ),
+            )
+            .group_by(scope.c.budget_id)
+        )
+    if raw_rows:
+        parts.append(
+            _raw_spent(user_id, raw_rows, "raw_scope", lambda scope, t: t.date.between(scope.c.date_from, scope.c.date_to))
+        )
+    if undated_rows:
+        parts.append(_raw_spent(user_id, undated_rows, "undated_scope", lambda scope, t: t.date.is_(None)))
+    return parts[0] if len(parts) == 1 else union_all(*parts)
+
+
+def collect_budget_spent(budgets: Iterable[models.Budget], rows) -> Dict[int, float]:
+    spent: Dict[int, float] = {budget.id: 0.0 for budget in budgets}
+    for budget_id, value in rows:
+        spent[budget_id] += float(value or 0.0)
+    return spent
+
+
+def compute_budget_spent(db: Session, user_id: int, budgets: Iterable[models.Budget]) -> Dict[int, float]:
+    """Gasto de todos los presupuestos del usuario (una consulta salvo ámbitos muy grandes)."""
+    budgets = list(budgets)
+    rows = [row for stmt in budget_spent_statements(user_id, budgets) for row in db.execute(stmt)]
+    return collect_budget_spent(budgets, rows)
+
+
+# Fracciones del límite que disparan budget.threshold_crossed
+BUDGET_ALERT_THRESHOLDS = (0.8, 1.0)
+
+
+def _posting_counts(budget: models.Budget, posting: Posting) -> bool:
+    if posting.category_type != "expense":
+        return False
+    categories = budget_categories(budget)
+    if categories and posting.category_id not in categories:
+        return False
+    if budget.wallet_id and posting.wallet_id != budget.wallet_id:
+        return False
+    if budget.period_start and (posting.date is None or posting.date < budget.period_start):
+        return False
+    if budget.period_end and (posting.date is None or posting.date > budget.period_end):
+        return False
+    return True
+
+
+def crossed_budget_thresholds(db: Session, user_id: int, postings: Iterable[Posting]) -> list[dict]:
+    """Presupuestos cuyo progreso cruzó un umbral con estas transacciones ya confirmadas."""
+    expenses = [p for p in postings if p.category_type == "expense"]
+    if not expenses:
+        return []
+    budgets = (
+        db.query(models.Budget)
+        .options(selectinload(models.Budget.limits))
+        .filter(models.Budget.user_id == user_id)
+        .all()
+    )
+    added: Dict[int, float] = {}
+    affected = []
+    for budget in budgets:
+        amount = sum(float(p.amount) for p in expenses if _posting_counts(budget, p))
+        if amount and budget_limit_amount(budget):
+            added[budget.id] = amount
+            affected.append(budget)
+    if not affected:
+        return []
+
+    spent = compute_budget_spent(db, user_id, affected)
+    crossed = []
+    for budget in affected:
+        limit = budget_limit_amount(budget)
+        after = spent[budget.id] / limit
+        before = (spent[budget.id] - added[budget.id]) / limit
+        passed = [t for t in BUDGET_ALERT_THRESHOLDS if before < t <= after]
+        if passed:
+            crossed.append(
+                {
+                    "budget_id": budget.id,
+                    "name": budget.name,
+                    "threshold": max(passed),
+                    "spent": spent[budget.id],
+                    "limit_amount": limit,
+                    "progress": after,
+                }
+            )
+    return crossed
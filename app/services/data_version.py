@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.cache import get_response_cache
+from app.db import models
+from app.db.dialect import upsert_insert
+
+
+def get_data_version(db: Session, user_id: int) -> int:
+    version = (
+        db.query(models.UserDataVersion.version)
+        .filter(models.UserDataVersion.user_id == user_id)
+        .scalar()
+    )
+    return version or 0
+
+
+def bump_data_version(db: Session, user_id: int) -> None:
+    """Incrementa la versión de datos del usuario dentro de la transacción en curso.
+
+    Se debe llamar antes del commit de cada escritura para que el ETag cambie
+    exactamente cuando los datos cambian.
+    """
+    get_response_cache().invalidate_user(user_id)
+    stmt = upsert_insert(db, models.UserDataVersion)
+    if stmt is not None:
+        db.execute(
+            stmt.values(user_id=user_id, version=1).on_conflict_do_update(
+                index_elements=[models.UserDataVersion.user_id],
+                set_={"version": models.UserDataVersion.version + 1},
+            )
+        )
+        return
+    result = db.execute(
+        update(models.UserDataVersion)
+        .where(models.UserDataVersion.user_id == user_id)
+        .values(version=models.UserDataVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        db.add(models.UserDataVersion(user_id=user_id, version=1))
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from app.db import models
+from app.db.database import SessionLocal
+
+
+FX_PIVOT = os.getenv("FX_PIVOT", "USD").upper()
+REPORTING_CURRENCY = os.getenv("REPORTING_CURRENCY", "COP").upper()
+
+
+class FxRateCache:
+    """Tasas de cambio en memoria, indexadas por moneda y ordenadas por fecha.
+
+    La tabla completa se carga de una vez y se recarga cuando vence el TTL o
+    tras invalidate(); cada consulta es una búsqueda binaria sin ir a la base.
+    version es un hash de las tasas cargadas: igual en todos los procesos y
+    reinicios que ven los mismos datos, así sirve en ETags y claves de caché
+    compartidas.
+    """
+
+    def __init__(self, ttl: float = 3600.0, pivot: str = FX_PIVOT):
+        self.ttl = ttl
+        self.pivot = pivot
+        self.version = ""
+        self._dates: Dict[str, list] = {}
+        self._rates: Dict[str, list] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded_at = None
+
+    def ensure_fresh(self) -> None:
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.ttl:
+            return
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(models.FxRate.currency, models.FxRate.date, models.FxRate.units_per_pivot)
+                .order_by(models.FxRate.currency, models.FxRate.date)
+                .all()
+            )
+        finally:
+            db.close()
+        dates: Dict[str, list] = {}
+        rates: Dict[str, list] = {}
+        digest = hashlib.sha1()
+        for currency, day, rate in rows:
+            dates.setdefault(currency, []).append(day)
+            rates.setdefault(currency, []).append(float(rate))
+            digest.update(f"{currency}:{day.isoformat()}:{float(rate)!r};".encode("utf-8"))
+        with self._lock:
+            self._dates, self._rates = dates, rates
+            self.version = digest.hexdigest()[:16]
+            self._loaded_at = time.monotonic()
+
+    def units_per_pivot(self, currency: str, on: date) -> Optional[float]:
+        if currency == self.pivot:
+            return 1.0
+        dates = self._dates.get(currency)
+        if not dates:
+            return None
+        i = bisect_right(dates, on) - 1
+        return self._rates[currency][i] if i >= 0 else None
+
+    def factors(self, currencies: Iterable[str], target: str, on: date) -> Dict[str, Optional[float]]:
+        """Factor de conversión a `target` para cada moneda (None si falta alguna tasa)."""
+        target_units = self.units_per_pivot(target, on)
+        result: Dict[str, Optional[float]] = {}
+        for currency in set(currencies):
+            if currency == target:
+                result[currency] = 1.0
+                continue
+            units = self.units_per_pivot(currency, on)
+            result[currency] = target_units / units if units and target_units is not None else None
+        return result
+
+
+fx_rates = FxRateCache(ttl=float(os.getenv("FX_CACHE_TTL", "3600")))
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.events import publish_event
+from app.services.importer import ImportCancelled
+
+
+# Imports en segundo plano: un pool acotado de hilos, cada job con su propia
+# sesión. El estado vive en memoria del proceso (con varios workers de uvicorn,
+# el job se consulta en el proceso que lo recibió).
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+IMPORT_MAX_PENDING = int(os.getenv("IMPORT_MAX_PENDING", str(max(1, IMPORT_WORKERS) * 4)))
+IMPORT_JOB_RETENTION = float(os.getenv("IMPORT_JOB_RETENTION", "3600"))
+
+
+class ImportQueueFull(Exception):
+    pass
+
+
+class ImportJob:
+    def __init__(self, user_id: int, kind: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.progress: Dict[str, int] = {}
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def report(self, table: str, rows: int) -> None:
+        with self._lock:
+            self.progress[table] = rows
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            rows = sum(self.progress.values())
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "elapsed_seconds": elapsed,
+                "rows_per_second": rows / elapsed if elapsed > 0 else 0.0,
+                "result": self.result,
+                "error": self.error,
+            }
+
+    def _set(self, **fields) -> None:
+        with self._lock:
+            for key, value in fields.items():
+                setattr(self, key, value)
+
+
+ImportRunner = Callable[[Session, models.User, ImportJob], dict]
+
+
+class ImportJobManager:
+    def __init__(self, workers: int = IMPORT_WORKERS, max_pending: int = IMPORT_MAX_PENDING):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="import")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._jobs: Dict[str, ImportJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: int, kind: str, runner: ImportRunner, cleanup: Optional[Callable[[], None]] = None) -> ImportJob:
+        """Encola runner(db, user, job); lanza ImportQueueFull si no hay cupo."""
+        if not self._slots.acquire(blocking=False):
+            raise ImportQueueFull()
+        job = ImportJob(user_id, kind)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        future = self._executor.submit(self._run, job, runner, cleanup)
+        future.add_done_callback(lambda _f: self._slots.release())
+        return job
+
+    def get(self, job_id: str, user_id: int) -> Optional[ImportJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - IMPORT_JOB_RETENTION
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job: ImportJob, runner: ImportRunner, cleanup: Optional[Callable[[], None]]) -> None:
+        db = SessionLocal()
+        try:
+            if job.cancelled():
+                job._set(status="cancelled", finished_at=time.time())
+                return
+            job._set(status="running", started_at=time.time())
+            user = db.query(models.User).get(job.user_id)
+            result = runner(db, user, job)
+            job._set(status="finished", result=result, finished_at=time.time())
+            publish_event(job.user_id, "import.finished", {"job_id": job.id, **result})
+        except ImportCancelled:
+            job._set(status="cancelled", finished_at=time.time())
+        except Exception as e:
+            db.rollback()
+            job._set(status="failed", error=str(e), finished_at=time.time())
+        finally:
+            db.close()
+            if cleanup is not None:
+                cleanup()
+
+
+import_jobs = ImportJobManager()
@@ -1,13 +1,36 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 from datetime import datetime, timezone
 from decimal import Decimal, ROUND_HALF_UP
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import bindparam, create_engine, insert, text, update
+from sqlalchemy.orm import Session
 
 from app.db import models
+from app.services.data_version import bump_data_version
+from app.services.ledger import (
+    Posting,
+    apply_postings,
+    apply_wallet_deltas,
+    open_many_wallet_checkpoints,
+    reversed_posting,
+    signed_amount,
+)
+
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "5000"))
+
+
+# Orden estable de las transacciones de origen para poder continuar una importación
+_TX_ORDER_KEY = "COALESCE(date_created, 0)"
+
+
+class ImportCancelled(Exception):
+    pass
 
 
 def _to_date(ts: Optional[int]):
@@ -23,119 +46,495 @@ def _d2(amount: float | Decimal) -> Decimal:
     return (Decimal(str(amount))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
 
+def insert_returning_ids(db: Session, model, rows: List[dict]) -> List[int]:
+    """INSERT por lotes (executemany) devolviendo los ids en el orden de `rows`.
+
+    Postgres lo resuelve en lotes; SQLite emite un INSERT por fila, así que se usa
+    para tablas pequeñas (wallets, categorías).
+    """
+    if not rows:
+        return []
+    return (
+        db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows)
+        .scalars()
+        .all()
+    )
+
+
+class SourceEntry(NamedTuple):
+    pk: str
+    local_id: int
+    row_hash: str
+    # Delta que la fila sumó al balance de su wallet (solo transacciones); al
+    # reescribirla se revierte exactamente este valor
+    balance_delta: Optional[Decimal] = None
+
+
+class SourceMap:
+    """Mapa (archivo de origen, tabla, pk de origen) -> SourceEntry de un usuario.
+
+    Permite reimportar el mismo archivo insertando solo filas nuevas y
+    actualizando las que cambiaron; las búsquedas se hacen por lote.
+    """
+
+    def __init__(self, db: Session, user_id: int, source_id: str):
+        self.db = db
+        self.user_id = user_id
+        self.source_id = source_id
+
+    def lookup(self, table: str, pks: List[str]) -> Dict[str, SourceEntry]:
+        if not pks:
+            return {}
+        m = models.ImportSourceMap
+        rows = self.db.query(m.source_pk, m.local_id, m.row_hash, m.balance_delta).filter(
+            m.user_id == self.user_id,
+            m.source_id == self.source_id,
+            m.source_table == table,
+            m.source_pk.in_(pks),
+        )
+        return {row.source_pk: SourceEntry(*row) for row in rows}
+
+    def record(self, table: str, entries: List[tuple]) -> None:
+        """Registra filas recién insertadas: SourceEntry o (pk de origen, id local, hash)."""
+        if not entries:
+            return
+        entries = [SourceEntry(*entry) for entry in entries]
+        self.db.execute(
+            insert(models.ImportSourceMap.__table__),
+            [
+                {
+                    "user_id": self.user_id,
+                    "source_id": self.source_id,
+                    "source_table": table,
+                    "source_pk": entry.pk,
+                    "local_id": entry.local_id,
+                    "row_hash": entry.row_hash,
+                    "balance_delta": entry.balance_delta,
+                }
+                for entry in entries
+            ],
+        )
+
+    def update(self, table: str, entries: List[tuple]) -> None:
+        """Actualiza id local, hash y delta de filas ya mapeadas."""
+        if not entries:
+            return
+        entries = [SourceEntry(*entry) for entry in entries]
+        m = models.ImportSourceMap.__table__
+        self.db.execute(
+            update(m)
+            .where(
+                m.c.user_id == self.user_id,
+                m.c.source_id == self.source_id,
+                m.c.source_table == table,
+                m.c.source_pk == bindparam("pk"),
+            )
+            .values(
+                local_id=bindparam("new_local_id"),
+                row_hash=bindparam("new_hash"),
+                balance_delta=bindparam("new_delta"),
+            ),
+            [
+                {"pk": e.pk, "new_local_id": e.local_id, "new_hash": e.row_hash, "new_delta": e.balance_delta}
+                for e in entries
+            ],
+        )
+
+
+def row_hash(*values) -> str:
+    return hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+
+class TransactionBatchWriter:
+    """Camino rápido de inserción de transacciones para los importadores.
+
+    Acumula filas y las inserta por lotes con executemany; los efectos contables
+    (rollups y checkpoints) se aplican por lote y los deltas de balance se
+    acumulan por wallet para aplicarlos con un UPDATE por wallet en finish().
+    Con on_inserted, cada lote se inserta con RETURNING y se informa
+    (tag, id local) de cada fila agregada con tag.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        user_id: int,
+        batch_size: int = IMPORT_BATCH_SIZE,
+        on_inserted: Optional[Callable[[List[Tuple[object, int]]], None]] = None,
+    ):
+        self.db = db
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.on_inserted = on_inserted
+        self.count = 0
+        self.updated = 0
+        self.deltas: Dict[int, Decimal] = {}
+        self._rows: List[dict] = []
+        self._postings: List[Posting] = []
+        self._tags: List[object] = []
+
+    def _add_delta(self, wallet_id: int, delta: Decimal) -> None:
+        self.deltas[wallet_id] = self.deltas.get(wallet_id, Decimal("0")) + delta
+
+    def add(self, row: dict, category_type: str, balance_delta: Decimal, tag: object = None) -> None:
+        """row: columnas de Transaction sin user_id."""
+        self._rows.append({**row, "user_id": self.user_id})
+        self._postings.append(Posting(row["wallet_id"], row["category_id"], row["date"], category_type, row["amount"]))
+        self._tags.append(tag)
+        self._add_delta(row["wallet_id"], balance_delta)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    @property
+    def pending(self) -> int:
+        return len(self._rows)
+
+    def flush(self) -> None:
+        if not self._rows:
+            return
+        if self.on_inserted is not None:
+            ids = insert_returning_ids(self.db, models.Transaction, self._rows)
+            self.on_inserted([(tag, new_id) for tag, new_id in zip(self._tags, ids) if tag is not None])
+        else:
+            # Sin RETURNING: en SQLite pedir los ids en orden obliga a un INSERT por fila
+            self.db.execute(insert(models.Transaction), self._rows)
+        apply_postings(self.db, self.user_id, self._postings)
+        self.count += len(self._rows)
+        self._rows = []
+        self._postings = []
+        self._tags = []
+
+    def replace(self, changes: List[Tuple[int, dict, str, Decimal, Optional[Decimal]]]) -> List[int]:
+        """Reescribe transacciones existentes.
+
+        changes: (id local, fila nueva, tipo de categoría, delta de balance nuevo,
+        delta aplicado antes). Revierte el efecto contable anterior y aplica el
+        nuevo. Devuelve los ids que existían (los borrados localmente se ignoran).
+        """
+        if not changes:
+            return []
+        t = models.Transaction
+        old_rows = {
+            row.id: row
+            for row in self.db.query(t.id, t.amount, t.date, t.wallet_id, t.category_id, models.Category.type)
+            .join(models.Category, models.Category.id == t.category_id)
+            .filter(t.user_id == self.user_id, t.id.in_([change[0] for change in changes]))
+        }
+        params = []
+        postings: List[Posting] = []
+        for local_id, row, category_type, delta, applied_delta in changes:
+            old = old_rows.get(local_id)
+            if old is None:
+                continue
+            old_amount = Decimal(str(old.amount))
+            postings.append(
+                reversed_posting(Posting(old.wallet_id, old.category_id, old.date, old.type, old_amount))
+            )
+            postings.append(Posting(row["wallet_id"], row["category_id"], row["date"], category_type, row["amount"]))
+            if applied_delta is None:
+                # Mapeo sin delta registrado: se asume el signo de la categoría
+                applied_delta = signed_amount(old.type, old_amount)
+            self._add_delta(old.wallet_id, -applied_delta)
+            self._add_delta(row["wallet_id"], delta)
+            params.append({"txn_id": local_id, **{f"new_{k}": v for k, v in row.items()}})
+        if params:
+            table = t.__table__
+            self.db.execute(
+                update(table)
+                .where(table.c.id == bindparam("txn_id"))
+                .values({k: bindparam(f"new_{k}") for k in changes[0][1]}),
+                params,
+            )
+            apply_postings(self.db, self.user_id, postings)
+            self.updated += len(params)
+        return [p["txn_id"] for p in params]
+
+    def finish(self) -> Dict[int, Decimal]:
+        """Inserta lo pendiente y aplica los balances. Devuelve el nuevo balance por wallet."""
+        self.flush()
+        deltas, self.deltas = self.deltas, {}
+        return apply_wallet_deltas(self.db, deltas)
+
+
+def _existing_ids(db: Session, model, user_id: int, ids: List[int]) -> set:
+    if not ids:
+        return set()
+    return {row_id for (row_id,) in db.query(model.id).filter(model.user_id == user_id, model.id.in_(ids))}
+
+
+def source_identity(src) -> str:
+    """Identidad estable del archivo de origen: la pk de su wallet más antigua.
+
+    Se mantiene entre respaldos sucesivos de la misma app.
+    """
+    first = src.execute(text("SELECT wallet_pk FROM wallets ORDER BY date_created ASC LIMIT 1")).scalar()
+    return f"sqlite:{first}" if first is not None else "sqlite"
+
+
+def _sync_simple_table(
+    db: Session,
+    smap: SourceMap,
+    table: str,
+    model,
+    user_id: int,
+    rows: List[Tuple[str, dict]],
+    update_fields: Tuple[str, ...],
+    insert_defaults: Optional[dict] = None,
+) -> Tuple[Dict[str, int], List[int], Dict[str, int]]:
+    """Importa una tabla pequeña (wallets, categorías) de forma idempotente.
+
+    rows: (pk de origen, columnas). Solo update_fields se comparan y se
+    actualizan en filas ya importadas. Devuelve el mapa pk de origen -> id
+    local, los ids recién creados y los contadores inserted/updated/unchanged.
+    """
+    hashes = {pk: row_hash(*(row[f] for f in update_fields)) for pk, row in rows}
+    existing = smap.lookup(table, [pk for pk, _ in rows])
+    alive = _existing_ids(db, model, user_id, [entry.local_id for entry in existing.values()])
+
+    id_map: Dict[str, int] = {}
+    new_rows: List[Tuple[str, dict]] = []
+    changed: List[Tuple[str, int, dict]] = []
+    unchanged = 0
+    for pk, row in rows:
+        mapped = existing.get(pk)
+        if mapped is None or mapped.local_id not in alive:
+            # Nueva, o borrada localmente desde la última importación: se vuelve a crear
+            new_rows.append((pk, row))
+            continue
+        local_id = mapped.local_id
+        id_map[pk] = local_id
+        if mapped.row_hash == hashes[pk]:
+            unchanged += 1
+        else:
+            changed.append((pk, local_id, row))
+
+    new_ids = insert_returning_ids(
+        db, model, [{**row, **(insert_defaults or {}), "user_id": user_id} for _, row in new_rows]
+    )
+    fresh, remapped = [], []
+    for (pk, _row), new_id in zip(new_rows, new_ids):
+        id_map[pk] = new_id
+        (remapped if pk in existing else fresh).append((pk, new_id, hashes[pk]))
+    smap.record(table, fresh)
+
+    if changed:
+        t = model.__table__
+        db.execute(
+            update(t)
+            .where(t.c.id == bindparam("row_id"))
+            .values({f: bindparam(f"new_{f}") for f in update_fields}),
+            [{"row_id": local_id, **{f"new_{f}": row[f] for f in update_fields}} for _pk, local_id, row in changed],
+        )
+    smap.update(table, remapped + [(pk, local_id, hashes[pk]) for pk, local_id, _row in changed])
+    return id_map, new_ids, {"inserted": len(new_ids), "updated": len(changed), "unchanged": unchanged}
+
+
 def import_external_sqlite(
     sqlite_path: str,
     db: Session,
     user: models.User,
     default_currency: str = "COP",
+    progress: Optional[Callable[[str, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+    source_id: Optional[str] = None,
+    chunk_size: int = IMPORT_BATCH_SIZE,
 ) -> Dict[str, int]:
     """Import wallets, categories, and transactions from external SQLite schema into our DB for the given user.
 
+    Es idempotente por archivo de origen (source_id, por defecto source_identity()):
+    las filas ya importadas y sin cambios se omiten y las modificadas se actualizan.
+    Las filas borradas en el origen no se borran aquí.
+    Las transacciones se confirman cada chunk_size filas; si la importación se
+    interrumpe (falla o cancelación), la siguiente del mismo origen continúa
+    después de la última fila confirmada (resumed_after en el resultado).
+    progress(tabla, filas) se llama tras cada lote; si should_cancel() devuelve True
+    entre lotes se descarta el lote en curso y se lanza ImportCancelled.
     Returns a dict with counters.
     """
+    report = progress or (lambda _table, _rows: None)
+
+    def check_cancel():
+        if should_cancel is not None and should_cancel():
+            db.rollback()
+            raise ImportCancelled()
+
     src_engine = create_engine(
         f"sqlite:///{sqlite_path}", connect_args={"check_same_thread": False}
     )
-    SrcSession = sessionmaker(bind=src_engine, autoflush=False, autocommit=False)
-    src = SrcSession()
-
-    wallet_map: Dict[str, int] = {}
-    category_map: Dict[str, int] = {}
+    src = src_engine.connect()
 
     try:
-        # Wallets
-        wallets_rs = src.execute(
+        smap = SourceMap(db, user.id, source_id or source_identity(src))
+
+        # Wallets (el balance lo llevan las transacciones; no se compara)
+        wallet_rows = src.execute(
             text(
                 "SELECT wallet_pk, name, currency FROM wallets ORDER BY date_created ASC"
             )
+        ).mappings().all()
+        wallet_map, new_wallet_ids, wallet_counts = _sync_simple_table(
+            db,
+            smap,
+            "wallets",
+            models.Wallet,
+            user.id,
+            [
+                (str(row.get("wallet_pk")), {"name": row.get("name"), "currency": row.get("currency") or default_currency})
+                for row in wallet_rows
+            ],
+            ("name", "currency"),
+            insert_defaults={"balance": Decimal("0.00")},
         )
-        wallet_count = 0
-        for row in wallets_rs.mappings():
-            name = row.get("name")
-            currency = row.get("currency") or default_currency
-            w = models.Wallet(
-                name=name, currency=currency, balance=Decimal("0.00"), user_id=user.id
-            )
-            db.add(w)
-            db.flush()
-            wallet_map[str(row.get("wallet_pk"))] = w.id
-            wallet_count += 1
+        open_many_wallet_checkpoints(db, {wallet_id: 0 for wallet_id in new_wallet_ids})
+        bump_data_version(db, user.id)
         db.commit()
+        report("wallets", len(wallet_rows))
+        check_cancel()
 
-        # Categories
-        cats_rs = src.execute(
+        # Categories (el tipo de una categoría ya importada no se cambia: afectaría
+        # a sus transacciones ya contabilizadas)
+        cat_rows = src.execute(
             text(
                 "SELECT category_pk, name, income FROM categories ORDER BY date_created ASC"
             )
+        ).mappings().all()
+        category_map, _new_category_ids, category_counts = _sync_simple_table(
+            db,
+            smap,
+            "categories",
+            models.Category,
+            user.id,
+            [
+                (
+                    str(row.get("category_pk")),
+                    {"name": row.get("name"), "type": "income" if int(row.get("income") or 0) == 1 else "expense"},
+                )
+                for row in cat_rows
+            ],
+            ("name",),
         )
-        cat_count = 0
-        for row in cats_rs.mappings():
-            name = row.get("name")
-            income_flag = int(row.get("income") or 0)
-            ctype = "income" if income_flag == 1 else "expense"
-            c = models.Category(name=name, type=ctype, user_id=user.id)
-            db.add(c)
-            db.flush()
-            category_map[str(row.get("category_pk"))] = c.id
-            cat_count += 1
+        category_types = dict(
+            db.query(models.Category.id, models.Category.type).filter(
+                models.Category.id.in_(list(category_map.values()))
+            )
+        ) if category_map else {}
+        bump_data_version(db, user.id)
         db.commit()
+        report("categories", len(cat_rows))
+        check_cancel()
 
-        # Transactions
+        # Transactions: lectura por lotes en orden (date_created, pk) desde el
+        # origen. Cada lote se confirma por separado junto con el checkpoint, así
+        # que una falla solo pierde el lote en curso y la memoria no crece con el
+        # archivo. Por lote, una consulta al mapa de origen decide qué se
+        # inserta, qué se reescribe y qué se omite.
+        checkpoint = db.get(models.ImportCheckpoint, (user.id, smap.source_id))
+        done_before = checkpoint.transactions_done if checkpoint else 0
+        resume_sql, resume_params = "", {}
+        if checkpoint is not None:
+            resume_sql = (
+                f"WHERE {_TX_ORDER_KEY} > :last_ts "
+                f"OR ({_TX_ORDER_KEY} = :last_ts AND CAST(transaction_pk AS TEXT) > :last_pk) "
+            )
+            resume_params = {"last_ts": checkpoint.last_date_created, "last_pk": checkpoint.last_source_pk}
         tx_rs = src.execute(
             text(
-                "SELECT transaction_pk, name, note, amount, category_fk, wallet_fk, date_created, income "
-                "FROM transactions ORDER BY date_created ASC"
-            )
+                "SELECT transaction_pk, name, note, amount, category_fk, wallet_fk, date_created "
+                f"FROM transactions {resume_sql}"
+                f"ORDER BY {_TX_ORDER_KEY} ASC, CAST(transaction_pk AS TEXT) ASC"
+            ).execution_options(yield_per=chunk_size),
+            resume_params,
+        )
+        writer = TransactionBatchWriter(
+            db,
+            user.id,
+            batch_size=chunk_size,
+            on_inserted=lambda tagged: smap.record(
+                "transactions", [SourceEntry(pk, new_id, h, delta) for (pk, h, delta), new_id in tagged]
+            ),
         )
-        tx_count = 0
         skipped_wallet = 0
         skipped_category = 0
-        for row in tx_rs.mappings():
-            wallet_fk = str(row.get("wallet_fk")) if row.get("wallet_fk") is not None else None
-            category_fk = str(row.get("category_fk")) if row.get("category_fk") is not None else None
-            wallet_id = wallet_map.get(wallet_fk) if wallet_fk else None
-            category_id = category_map.get(category_fk) if category_fk else None
-            if not wallet_id:
-                skipped_wallet += 1
-                continue
-            if not category_id:
-                skipped_category += 1
-                continue
+        unchanged = 0
+        for batch in tx_rs.mappings().partitions(chunk_size):
+            check_cancel()
+            existing = smap.lookup("transactions", [str(row.get("transaction_pk")) for row in batch])
+            changes: List[Tuple[int, dict, str, Decimal]] = []
+            changed_hashes: Dict[int, Tuple[str, str, Decimal]] = {}
+            for row in batch:
+                wallet_fk = row.get("wallet_fk")
+                category_fk = row.get("category_fk")
+                wallet_id = wallet_map.get(str(wallet_fk)) if wallet_fk is not None else None
+                category_id = category_map.get(str(category_fk)) if category_fk is not None else None
+                if not wallet_id:
+                    skipped_wallet += 1
+                    continue
+                if not category_id:
+                    skipped_category += 1
+                    continue
 
-            amount = _d2(row.get("amount") or 0)
-            desc_parts = [p for p in [row.get("name"), row.get("note")] if p]
-            description = " - ".join(desc_parts) if desc_parts else None
-            dt = _to_date(row.get("date_created"))
-            income_flag = int(row.get("income") or 0)
-
-            t = models.Transaction(
-                amount=amount,
-                description=description,
-                date=dt,
-                wallet_id=wallet_id,
-                category_id=category_id,
-                user_id=user.id,
+                amount = _d2(row.get("amount") or 0)
+                desc_parts = [p for p in [row.get("name"), row.get("note")] if p]
+                category_type = category_types[category_id]
+                # Mismo signo que rollups, checkpoints y reconcile: el tipo de la categoría
+                # (la marca income de la transacción de origen se ignora)
+                delta = signed_amount(category_type, amount)
+                values = {
+                    "amount": amount,
+                    "description": " - ".join(desc_parts) if desc_parts else None,
+                    "date": _to_date(row.get("date_created")),
+                    "wallet_id": wallet_id,
+                    "category_id": category_id,
+                }
+                pk = str(row.get("transaction_pk"))
+                h = row_hash(*(values[k] for k in sorted(values)), delta)
+                mapped = existing.get(pk)
+                if mapped is None:
+                    writer.add(values, category_type, delta, tag=(pk, h, delta))
+                elif mapped.row_hash == h:
+                    unchanged += 1
+                else:
+                    changes.append((mapped.local_id, values, category_type, delta, mapped.balance_delta))
+                    changed_hashes[mapped.local_id] = (pk, h, delta)
+            replaced = writer.replace(changes)
+            smap.update("transactions", [SourceEntry(changed_hashes[i][0], i, *changed_hashes[i][1:]) for i in replaced])
+            writer.finish()
+            last = batch[-1]
+            processed = done_before + writer.count + writer.updated + unchanged + skipped_wallet + skipped_category
+            db.merge(
+                models.ImportCheckpoint(
+                    user_id=user.id,
+                    source_id=smap.source_id,
+                    last_date_created=int(last.get("date_created") or 0),
+                    last_source_pk=str(last.get("transaction_pk")),
+                    transactions_done=processed,
+                )
             )
-            db.add(t)
-
-            # Update wallet balance
-            w = db.query(models.Wallet).get(wallet_id)
-            if income_flag == 1:
-                w.balance = _d2((w.balance or Decimal("0")) + amount)
-            else:
-                w.balance = _d2((w.balance or Decimal("0")) - amount)
-
-            tx_count += 1
+            bump_data_version(db, user.id)
+            db.commit()
+            report("transactions", processed)
 
+        # Terminada: la próxima importación de este origen vuelve a revisar todo
+        db.query(models.ImportCheckpoint).filter(
+            models.ImportCheckpoint.user_id == user.id,
+            models.ImportCheckpoint.source_id == smap.source_id,
+        ).delete(synchronize_session=False)
         db.commit()
 
         return {
-            "wallets": wallet_count,
-            "categories": cat_count,
-            "transactions": tx_count,
+            "wallets": wallet_counts["inserted"],
+            "categories": category_counts["inserted"],
+            "transactions": writer.count,
+            "wallets_updated": wallet_counts["updated"],
+            "categories_updated": category_counts["updated"],
+            "transactions_updated": writer.updated,
+            "wallets_unchanged": wallet_counts["unchanged"],
+            "categories_unchanged": category_counts["unchanged"],
+            "transactions_unchanged": unchanged,
             "skipped_missing_wallet": skipped_wallet,
             "skipped_missing_category": skipped_category,
+            "resumed_after": done_before,
         }
     finally:
         src.close()
-
+        src_engine.dispose()
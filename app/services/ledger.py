@@ -0,0 +1,390 @@
+from __future__ import annotations
+
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import and_, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.db.dialect import bucket_start, upsert_insert
+
+
+class Posting(NamedTuple):
+    """Efecto contable de una transacción ya insertada.
+
+    Para revertir una transacción (p. ej. al modificarla) se usa el monto negado
+    y count=-1.
+    """
+
+    wallet_id: int
+    category_id: int
+    date: Optional[date]
+    category_type: str
+    amount: Decimal
+    count: int = 1
+
+
+OPENING_MONTH = date(1, 1, 1)
+# Mes ficticio de las transacciones sin fecha: va después de la apertura y antes
+# de cualquier mes real, así el saldo a cualquier fecha las incluye.
+UNDATED_MONTH = date(1, 2, 1)
+
+
+def reversed_posting(p: Posting) -> Posting:
+    return p._replace(amount=-p.amount, count=-p.count)
+
+
+def to_amount(amount: float | Decimal) -> Decimal:
+    return (Decimal(str(amount))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def signed_amount(category_type: str, amount: Decimal) -> Decimal:
+    return -amount if category_type == "expense" else amount
+
+
+def month_start(value: date) -> date:
+    return value.replace(day=1)
+
+
+def checkpoint_month(value: Optional[date]) -> date:
+    return month_start(value) if value is not None else UNDATED_MONTH
+
+
+def adjust_wallet_balance(
+    db: Session,
+    wallet_id: int,
+    delta: Decimal,
+    user_id: Optional[int] = None,
+) -> Optional[Decimal]:
+    """Suma delta al balance con un único UPDATE atómico (sin leer-modificar-escribir).
+
+    Devuelve el nuevo balance, o None si la wallet no existe o no pertenece a user_id.
+    """
+    stmt = (
+        update(models.Wallet)
+        .where(models.Wallet.id == wallet_id)
+        .values(balance=func.coalesce(models.Wallet.balance, 0) + delta)
+        .execution_options(synchronize_session=False)
+    )
+    if user_id is not None:
+        stmt = stmt.where(models.Wallet.user_id == user_id)
+    if db.get_bind().dialect.update_returning:
+        return db.execute(stmt.returning(models.Wallet.balance)).scalar_one_or_none()
+    if db.execute(stmt).rowcount == 0:
+        return None
+    return db.query(models.Wallet.balance).filter(models.Wallet.id == wallet_id).scalar()
+
+
+def apply_wallet_deltas(db: Session, deltas: Dict[int, Decimal]) -> Dict[int, Decimal]:
+    """Aplica un delta agregado por wallet con un UPDATE del lado SQL.
+
+    Se ordena por id para que escritores concurrentes tomen los locks de fila
+    siempre en el mismo orden. Devuelve el nuevo balance de cada wallet modificada.
+    """
+    balances: Dict[int, Decimal] = {}
+    for wallet_id in sorted(deltas):
+        delta = deltas[wallet_id]
+        if not delta:
+            continue
+        balance = adjust_wallet_balance(db, wallet_id, delta)
+        if balance is not None:
+            balances[wallet_id] = balance
+    return balances
+
+
+def apply_rollups(db: Session, user_id: int, postings: Iterable[Posting]) -> None:
+    """Suma las transacciones a monthly_rollups con un upsert por lote.
+
+    Las transacciones sin fecha no entran al rollup: ninguna consulta por rango las incluye.
+    """
+    totals: Dict[tuple, list] = {}
+    for p in postings:
+        if p.date is None:
+            continue
+        key = (p.wallet_id, p.category_id, month_start(p.date))
+        acc = totals.setdefault(key, [Decimal("0"), Decimal("0"), 0, 0])
+        if p.category_type == "expense":
+            acc[1] += p.amount
+            acc[3] += p.count
+        else:
+            acc[0] += p.amount
+            acc[2] += p.count
+    if not totals:
+        return
+
+    rows = [
+        {
+            "user_id": user_id,
+            "wallet_id": wallet_id,
+            "category_id": category_id,
+            "month": month,
+            "income": acc[0],
+            "expense": acc[1],
+            "income_count": acc[2],
+            "expense_count": acc[3],
+        }
+        # Orden estable para que escritores concurrentes bloqueen en el mismo orden
+        for (wallet_id, category_id, month), acc in sorted(totals.items())
+    ]
+    table = models.MonthlyRollup
+    stmt = upsert_insert(db, table)
+    if stmt is not None:
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.user_id, table.wallet_id, table.category_id, table.month],
+                set_={
+                    "income": table.income + stmt.excluded.income,
+                    "expense": table.expense + stmt.excluded.expense,
+                    "income_count": table.income_count + stmt.excluded.income_count,
+                    "expense_count": table.expense_count + stmt.excluded.expense_count,
+                },
+            ),
+            rows,
+        )
+        return
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(
+                table.user_id == row["user_id"],
+                table.wallet_id == row["wallet_id"],
+                table.category_id == row["category_id"],
+                table.month == row["month"],
+            )
+            .values(
+                income=table.income + row["income"],
+                expense=table.expense + row["expense"],
+                income_count=table.income_count + row["income_count"],
+                expense_count=table.expense_count + row["expense_count"],
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table), [row])
+
+
+def rebuild_monthly_rollups(db: Session, user_id: Optional[int] = None) -> int:
+    """Recalcula monthly_rollups desde transactions con un INSERT ... SELECT agrupado."""
+    t = models.Transaction
+    c = models.Category
+    table = models.MonthlyRollup
+
+    wipe = delete(table)
+    if user_id is not None:
+        wipe = wipe.where(table.user_id == user_id)
+    db.execute(wipe.execution_options(synchronize_session=False))
+
+    is_income = c.type != "expense"
+    month = bucket_start(db, t.date, "month")
+    source = (
+        db.query(
+            t.user_id,
+            t.wallet_id,
+            t.category_id,
+            month,
+            func.sum(case((is_income, t.amount), else_=0)),
+            func.sum(case((is_income, 0), else_=t.amount)),
+            func.sum(case((is_income, 1), else_=0)),
+            func.sum(case((is_income, 0), else_=1)),
+        )
+        .join(c, c.id == t.category_id)
+        .filter(and_(t.date.isnot(None), t.wallet_id.isnot(None), t.user_id.isnot(None)))
+    )
+    if user_id is not None:
+        source = source.filter(t.user_id == user_id)
+    source = source.group_by(t.user_id, t.wallet_id, t.category_id, month)
+    result = db.execute(
+        insert(table).from_select(
+            ["user_id", "wallet_id", "category_id", "month", "income", "expense", "income_count", "expense_count"],
+            source.statement,
+        )
+    )
+    return result.rowcount
+
+
+def open_wallet_checkpoints(db: Session, wallet_id: int, opening_balance: Decimal | float = 0) -> None:
+    open_many_wallet_checkpoints(db, {wallet_id: opening_balance})
+
+
+def open_many_wallet_checkpoints(db: Session, openings: Dict[int, Decimal | float]) -> None:
+    if not openings:
+        return
+    db.execute(
+        insert(models.WalletBalanceCheckpoint),
+        [
+            {"wallet_id": wallet_id, "month": OPENING_MONTH, "closing_balance": to_amount(opening or 0)}
+            for wallet_id, opening in openings.items()
+        ],
+    )
+
+
+def apply_checkpoints(db: Session, postings: Iterable[Posting]) -> None:
+    """Propaga las transacciones a los saldos de cierre mensuales.
+
+    Por cada (wallet, mes) se crea la fila del mes copiando el cierre anterior
+    si no existía, y se suma el delta a ese mes y a todos los posteriores. Las
+    transacciones sin fecha van a UNDATED_MONTH. Las wallets sin fila de
+    apertura (anteriores a esta tabla) se ignoran hasta que
+    backfill_wallet_checkpoints las reconstruye.
+    """
+    deltas: Dict[tuple, Decimal] = {}
+    for p in postings:
+        key = (p.wallet_id, checkpoint_month(p.date))
+        deltas[key] = deltas.get(key, Decimal("0")) + signed_amount(p.category_type, p.amount)
+
+    ck = models.WalletBalanceCheckpoint
+    for (wallet_id, month), delta in sorted(deltas.items()):
+        previous = (
+            select(literal(wallet_id), literal(month), ck.closing_balance)
+            .where(ck.wallet_id == wallet_id, ck.month < month)
+            .order_by(ck.month.desc())
+            .limit(1)
+        )
+        stmt = upsert_insert(db, ck)
+        if stmt is not None:
+            stmt = stmt.from_select(["wallet_id", "month", "closing_balance"], previous).on_conflict_do_nothing()
+        else:
+            exists = select(ck.wallet_id).where(ck.wallet_id == wallet_id, ck.month == month).exists()
+            stmt = insert(ck).from_select(["wallet_id", "month", "closing_balance"], previous.where(~exists))
+        db.execute(stmt)
+        if delta:
+            db.execute(
+                update(ck)
+                .where(ck.wallet_id == wallet_id, ck.month >= month)
+                .values(closing_balance=ck.closing_balance + delta)
+                .execution_options(synchronize_session=False)
+            )
+
+
+def apply_postings(db: Session, user_id: int, postings: Iterable[Posting]) -> None:
+    """Mantiene rollups y checkpoints de saldo para transacciones recién insertadas."""
+    postings = list(postings)
+    apply_rollups(db, user_id, postings)
+    apply_checkpoints(db, postings)
+
+
+def _signed_sum():
+    return func.coalesce(
+        func.sum(case((models.Category.type == "expense", -models.Transaction.amount), else_=models.Transaction.amount)),
+        0,
+    )
+
+
+def infer_wallet_openings(db: Session, wallet_ids: List[int]) -> Dict[int, Optional[Decimal]]:
+    """Saldo de apertura de wallets sin fila de apertura: balance guardado − suma con signo de sus transacciones.
+
+    Antes de los checkpoints create_wallet guardaba el balance inicial sin
+    transacción; esta diferencia lo recupera. None si la wallet no tiene balance.
+    """
+    if not wallet_ids:
+        return {}
+    t = models.Transaction
+    totals = dict(
+        db.query(t.wallet_id, _signed_sum())
+        .select_from(t)
+        .join(models.Category, models.Category.id == t.category_id)
+        .filter(t.wallet_id.in_(wallet_ids))
+        .group_by(t.wallet_id)
+    )
+    balances = dict(db.query(models.Wallet.id, models.Wallet.balance).filter(models.Wallet.id.in_(wallet_ids)))
+    return {
+        wallet_id: None
+        if balances.get(wallet_id) is None
+        else to_amount(Decimal(str(balances[wallet_id])) - Decimal(str(totals.get(wallet_id) or 0)))
+        for wallet_id in wallet_ids
+    }
+
+
+def rebuild_wallet_checkpoints(db: Session, wallet_id: int, opening: Optional[Decimal] = None) -> None:
+    """Reconstruye los cierres mensuales de una wallet desde su historial completo.
+
+    Sin opening explícito conserva el saldo de apertura registrado; si la wallet
+    no lo tiene (creada antes de esta tabla) lo infiere de su balance guardado
+    con infer_wallet_openings, y solo abre en 0 cuando el balance es desconocido.
+    """
+    t = models.Transaction
+    ck = models.WalletBalanceCheckpoint
+    if opening is None:
+        opening = (
+            db.query(ck.closing_balance).filter(ck.wallet_id == wallet_id, ck.month == OPENING_MONTH).scalar()
+        )
+    if opening is None:
+        opening = infer_wallet_openings(db, [wallet_id])[wallet_id]
+    db.execute(delete(ck).where(ck.wallet_id == wallet_id).execution_options(synchronize_session=False))
+
+    month = bucket_start(db, t.date, "month")
+    monthly = (
+        db.query(month.label("month"), _signed_sum().label("delta"))
+        .select_from(t)
+        .join(models.Category, models.Category.id == t.category_id)
+        .filter(t.wallet_id == wallet_id)
+        .group_by(month)
+        .all()
+    )
+    running = Decimal(str(opening or 0))
+    rows = [{"wallet_id": wallet_id, "month": OPENING_MONTH, "closing_balance": to_amount(running)}]
+    deltas = {
+        UNDATED_MONTH if row.month is None else (
+            row.month if isinstance(row.month, date) else date.fromisoformat(row.month)
+        ): Decimal(str(row.delta))
+        for row in monthly
+    }
+    for value in sorted(deltas):
+        running += deltas[value]
+        rows.append({"wallet_id": wallet_id, "month": value, "closing_balance": to_amount(running)})
+    db.execute(insert(ck), rows)
+
+
+def backfill_wallet_checkpoints(db: Session, batch_size: int = 500) -> int:
+    """Construye los checkpoints de las wallets que no tienen fila de apertura.
+
+    La apertura se infiere del balance guardado (infer_wallet_openings). Se
+    corre al arrancar y tras importar una base (como el llenado de rollups);
+    las consultas nunca escriben checkpoints. Devuelve cuántas wallets se
+    reconstruyeron.
+    """
+    ck = models.WalletBalanceCheckpoint
+    has_opening = select(ck.wallet_id).where(ck.wallet_id == models.Wallet.id, ck.month == OPENING_MONTH).exists()
+    wallet_ids = [wallet_id for (wallet_id,) in db.query(models.Wallet.id).filter(~has_opening).order_by(models.Wallet.id)]
+    for i in range(0, len(wallet_ids), batch_size):
+        batch = wallet_ids[i : i + batch_size]
+        for wallet_id, opening in infer_wallet_openings(db, batch).items():
+            rebuild_wallet_checkpoints(db, wallet_id, opening)
+    return len(wallet_ids)
+
+
+def balance_as_of(db: Session, wallet: models.Wallet, as_of: date) -> Decimal:
+    """Saldo de la wallet al cierre del día as_of: último cierre mensual + movimientos del mes.
+
+    Solo lee. Una wallet aún sin checkpoints parte de su balance guardado y
+    descuenta lo posterior a as_of (apertura inferida, ver
+    infer_wallet_openings); si no tiene balance, suma su historial desde 0.
+    """
+    ck = models.WalletBalanceCheckpoint
+    t = models.Transaction
+    first_day = month_start(as_of)
+    checkpoint = (
+        db.query(ck.closing_balance)
+        .filter(ck.wallet_id == wallet.id, ck.month < first_day)
+        .order_by(ck.month.desc())
+        .limit(1)
+        .scalar()
+    )
+    sign = 1
+    if checkpoint is not None:
+        in_range = and_(t.date >= first_day, t.date <= as_of)
+    elif wallet.balance is not None:
+        checkpoint, sign = wallet.balance, -1
+        in_range = t.date > as_of
+    else:
+        in_range = or_(t.date <= as_of, t.date.is_(None))
+    delta = (
+        db.query(_signed_sum())
+        .select_from(t)
+        .join(models.Category, models.Category.id == t.category_id)
+        .filter(t.user_id == wallet.user_id, t.wallet_id == wallet.id, in_range)
+        .scalar()
+    )
+    return Decimal(str(checkpoint or 0)) + sign * Decimal(str(delta or 0))
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import logging
+from decimal import Decimal
+from typing import Dict, List, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.events import has_subscribers, publish_event
+from app.services.budget_progress import crossed_budget_thresholds
+from app.services.ledger import Posting
+
+
+logger = logging.getLogger(__name__)
+
+
+def publish_balances(user_id: int, balances: Dict[int, Decimal]) -> None:
+    for wallet_id, balance in sorted(balances.items()):
+        publish_event(user_id, "wallet.balance_changed", {"wallet_id": wallet_id, "balance": float(balance)})
+
+
+def publish_postings(
+    db: Session,
+    user_id: int,
+    transaction_ids: Sequence[int],
+    postings: List[Posting],
+    balances: Dict[int, Decimal],
+) -> None:
+    """Eventos de transacciones ya confirmadas: creación, saldos y umbrales de presupuesto.
+
+    Se llama después del commit: nunca lanza, para que la escritura ya guardada
+    responda bien aunque falle una notificación.
+    """
+    if not transaction_ids or not has_subscribers(user_id):
+        return
+    try:
+        publish_event(
+            user_id,
+            "transaction.created",
+            {"ids": list(transaction_ids), "wallet_ids": sorted({p.wallet_id for p in postings})},
+        )
+        publish_balances(user_id, balances)
+        for crossed in crossed_budget_thresholds(db, user_id, postings):
+            publish_event(user_id, "budget.threshold_crossed", crossed)
+    except Exception:
+        logger.exception("No se pudieron publicar los eventos de transacciones del usuario %s", user_id)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import and_, bindparam, case, func, select, update
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.services.data_version import bump_data_version
+from app.services.ledger import OPENING_MONTH, rebuild_wallet_checkpoints, to_amount
+from app.services.notifications import publish_balances
+
+
+class WalletDrift(NamedTuple):
+    wallet_id: int
+    user_id: int
+    stored: Decimal
+    expected: Decimal
+    drift: Decimal
+
+
+class ReconcileResult(NamedTuple):
+    users_checked: int
+    wallets_checked: int
+    drifted: List[WalletDrift]
+    fixed: int
+    # Wallets sin saldo de apertura registrado: no se pueden comparar ni se corrigen
+    without_opening: List[int]
+
+
+def _batch_statement(user_ids: List[int]):
+    """Balance esperado por wallet para un lote de usuarios en una sola consulta.
+
+    esperado = saldo de apertura registrado + suma con signo de sus
+    transacciones según categories.type. opening es NULL en las wallets
+    anteriores a los checkpoints.
+    """
+    t = models.Transaction
+    c = models.Category
+    w = models.Wallet
+    ck = models.WalletBalanceCheckpoint
+    totals = (
+        select(
+            t.wallet_id.label("wallet_id"),
+            func.sum(case((c.type == "expense", -t.amount), else_=t.amount)).label("total"),
+        )
+        .join(c, c.id == t.category_id)
+        .where(t.user_id.in_(user_ids))
+        .group_by(t.wallet_id)
+        .subquery("totals")
+    )
+    return (
+        select(
+            w.id,
+            w.user_id,
+            w.balance,
+            ck.closing_balance.label("opening"),
+            func.coalesce(totals.c.total, 0).label("total"),
+        )
+        .outerjoin(ck, and_(ck.wallet_id == w.id, ck.month == OPENING_MONTH))
+        .outerjoin(totals, totals.c.wallet_id == w.id)
+        .where(w.user_id.in_(user_ids))
+        .order_by(w.id)
+    )
+
+
+def _chunks(ids: List[int], size: int) -> Iterable[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
+
+
+def reconcile_balances(
+    db: Session,
+    user_ids: Optional[List[int]] = None,
+    batch_size: int = 500,
+    fix: bool = False,
+) -> ReconcileResult:
+    """Compara Wallet.balance con el recalculado desde transactions y opcionalmente lo corrige.
+
+    Las wallets sin saldo de apertura registrado (anteriores a los checkpoints)
+    guardaban ahí su saldo inicial, así que no hay contra qué compararlas: se
+    reportan aparte y nunca se reescribe su balance. Con fix se les registra la
+    apertura inferida (balance − transacciones) para que queden ancladas. La
+    corrección suma la diferencia en SQL, de modo que no pisa movimientos
+    concurrentes.
+    """
+    if user_ids is None:
+        user_ids = [uid for (uid,) in db.query(models.User.id).order_by(models.User.id)]
+
+    wallets_checked = 0
+    drifted: List[WalletDrift] = []
+    without_opening: List[int] = []
+    for batch in _chunks(user_ids, batch_size):
+        for row in db.execute(_batch_statement(batch)):
+            wallets_checked += 1
+            if row.opening is None:
+                without_opening.append(row.id)
+                continue
+            stored = to_amount(row.balance or 0)
+            expected = to_amount(Decimal(str(row.opening)) + Decimal(str(row.total)))
+            if stored != expected:
+                drifted.append(WalletDrift(row.id, row.user_id, stored, expected, stored - expected))
+
+    fixed = 0
+    if fix and drifted:
+        w = models.Wallet.__table__
+        db.execute(
+            update(w)
+            .where(w.c.id == bindparam("wallet_id"))
+            .values(balance=func.coalesce(w.c.balance, 0) - bindparam("drift")),
+            [{"wallet_id": d.wallet_id, "drift": d.drift} for d in drifted],
+        )
+        for user_id in sorted({d.user_id for d in drifted}):
+            bump_data_version(db, user_id)
+        db.commit()
+        fixed = len(drifted)
+        for d in drifted:
+            publish_balances(d.user_id, {d.wallet_id: d.expected})
+
+    if fix and without_opening:
+        for wallet_id in without_opening:
+            rebuild_wallet_checkpoints(db, wallet_id)
+        db.commit()
+
+    return ReconcileResult(len(user_ids), wallets_checked, drifted, fixed, without_opening)
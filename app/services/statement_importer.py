@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import csv
+import html
+import io
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db import models
+from app.services.data_version import bump_data_version
+from app.services.importer import (
+    IMPORT_BATCH_SIZE,
+    ImportCancelled,
+    SourceEntry,
+    SourceMap,
+    TransactionBatchWriter,
+    row_hash,
+)
+from app.services.ledger import signed_amount, to_amount
+
+
+# Importación de extractos bancarios (CSV / OFX). El archivo se lee como stream
+# y se inserta por lotes con el mismo camino rápido del importador de SQLite;
+# cada lote se confirma por separado. Reimportar un extracto que se solapa con
+# uno anterior omite los movimientos ya importados.
+STATEMENT_FORMATS = ("csv", "ofx")
+
+
+class StatementError(ValueError):
+    pass
+
+
+class StatementRow(NamedTuple):
+    pk: str  # identificador del movimiento dentro del origen
+    date: date
+    amount: Decimal  # con signo: negativo = salida
+    description: Optional[str]
+    category: Optional[str]  # categoría según el banco, si la trae
+
+
+def parse_amount(value: str, decimal_separator: str = ".") -> Decimal:
+    """Convierte montos como '1.234,56', '-$ 12.50' o '(12.50)' a Decimal."""
+    text = (value or "").strip()
+    negative = text.startswith("-") or text.endswith("-") or (text.startswith("(") and text.endswith(")"))
+    thousands = "," if decimal_separator == "." else "."
+    digits = re.sub(r"[^0-9,.]", "", text).replace(thousands, "").replace(decimal_separator, ".")
+    try:
+        amount = Decimal(digits)
+    except InvalidOperation:
+        raise StatementError(f"Monto inválido: {value!r}")
+    return to_amount(-amount if negative else amount)
+
+
+def _text_stream(stream: BinaryIO, encoding: str) -> io.TextIOWrapper:
+    # utf-8-sig descarta el BOM que agregan algunos bancos (y Excel)
+    encoding = encoding or "utf-8"
+    if encoding.lower().replace("_", "-") in ("utf-8", "utf8"):
+        encoding = "utf-8-sig"
+    return io.TextIOWrapper(stream, encoding=encoding, errors="replace", newline="")
+
+
+def iter_csv_rows(stream: BinaryIO, profile: models.StatementProfile) -> Iterator[Optional[StatementRow]]:
+    """Filas del CSV según el perfil; None para filas que no se pueden leer.
+
+    El CSV no trae un id por movimiento: se usa el hash de (fecha, monto,
+    descripción) más el número de repetición dentro del archivo.
+    """
+    reader = csv.DictReader(_text_stream(stream, profile.encoding), delimiter=profile.delimiter or ",")
+    columns = [profile.date_column, profile.amount_column, profile.debit_column, profile.credit_column]
+    missing = [c for c in columns if c and c not in (reader.fieldnames or [])]
+    if missing:
+        raise StatementError(f"Columnas no encontradas en el CSV: {', '.join(missing)}")
+
+    seen: Dict[str, int] = {}
+    for raw in reader:
+        try:
+            when = datetime.strptime((raw.get(profile.date_column) or "").strip(), profile.date_format).date()
+            if profile.amount_column:
+                amount = parse_amount(raw.get(profile.amount_column), profile.decimal_separator)
+            else:
+                credit = raw.get(profile.credit_column) or ""
+                debit = raw.get(profile.debit_column) or ""
+                amount = (parse_amount(credit, profile.decimal_separator) if credit.strip() else Decimal("0")) - (
+                    abs(parse_amount(debit, profile.decimal_separator)) if debit.strip() else Decimal("0")
+                )
+        except (ValueError, TypeError):
+            yield None
+            continue
+        description = (raw.get(profile.description_column) or "").strip() if profile.description_column else ""
+        category = (raw.get(profile.category_column) or "").strip() if profile.category_column else ""
+        key = row_hash(when, amount, description)
+        seen[key] = seen.get(key, 0) + 1
+        yield StatementRow(f"{key}#{seen[key]}", when, amount, description or None, category or None)
+
+
+_OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def _ofx_elements(text: io.TextIOBase, chunk_size: int = 64 * 1024) -> Iterator[Tuple[bool, str, str]]:
+    """(cierre, tag, valor) de un OFX, tanto SGML (1.x) como XML (2.x), leyendo por bloques."""
+    buffer = ""
+    while True:
+        chunk = text.read(chunk_size)
+        buffer += chunk
+        # Lo que sigue al último '<' puede estar incompleto hasta el próximo bloque
+        cut = buffer.rfind("<") if chunk else len(buffer)
+        if cut > 0:
+            for m in _OFX_TAG.finditer(buffer, 0, cut):
+                # OFX 2.x es XML: los valores traen entidades (&amp;, &lt;, ...)
+                yield m.group(1) == "/", m.group(2).upper(), html.unescape(m.group(3).strip())
+            buffer = buffer[cut:]
+        if not chunk:
+            return
+
+
+def iter_ofx_rows(stream: BinaryIO, profile: models.StatementProfile) -> Iterator[Optional[StatementRow]]:
+    """Movimientos (STMTTRN) del OFX; None para los que no se pueden leer."""
+    current: Optional[Dict[str, str]] = None
+    for closing, tag, value in _ofx_elements(_text_stream(stream, profile.encoding)):
+        if tag == "STMTTRN":
+            if current:
+                yield _ofx_row(current)
+            current = None if closing else {}
+        elif current is not None and not closing and value:
+            current[tag] = value
+    if current:
+        yield _ofx_row(current)
+
+
+def _ofx_row(fields: Dict[str, str]) -> Optional[StatementRow]:
+    try:
+        when = datetime.strptime(fields["DTPOSTED"][:8], "%Y%m%d").date()
+        raw_amount = fields["TRNAMT"]
+        amount = parse_amount(raw_amount, "," if "," in raw_amount and "." not in raw_amount else ".")
+    except (KeyError, ValueError):
+        return None
+    description = " - ".join(p for p in (fields.get("NAME"), fields.get("MEMO")) if p) or None
+    pk = fields.get("FITID") or row_hash(when, amount, description)
+    return StatementRow(pk, when, amount, description, fields.get("TRNTYPE"))
+
+
+def iter_statement_rows(stream: BinaryIO, profile: models.StatementProfile) -> Iterator[Optional[StatementRow]]:
+    if profile.format == "ofx":
+        return iter_ofx_rows(stream, profile)
+    return iter_csv_rows(stream, profile)
+
+
+class CategoryResolver:
+    """Elige la categoría de cada movimiento con las reglas del perfil.
+
+    Solo se consideran reglas cuya categoría es del tipo que indica el signo
+    (una devolución del restaurante no es un gasto). Primero la categoría del
+    extracto (igualdad sin mayúsculas), luego el texto de la regla dentro de la
+    descripción, y si nada coincide la categoría por defecto del perfil.
+    """
+
+    def __init__(self, profile: models.StatementProfile, category_types: Dict[int, str]):
+        self.types = category_types
+        self.default = {"income": profile.income_category_id, "expense": profile.expense_category_id}
+        self.exact: Dict[str, Dict[str, int]] = {"income": {}, "expense": {}}
+        self.contains: Dict[str, List[Tuple[str, int]]] = {"income": [], "expense": []}
+        for rule in profile.rules:
+            needle = rule.match.strip().lower()
+            kind = category_types[rule.category_id]
+            if needle and kind in self.exact:
+                self.exact[kind].setdefault(needle, rule.category_id)
+                self.contains[kind].append((needle, rule.category_id))
+
+    def resolve(self, row: StatementRow) -> Tuple[int, str]:
+        kind = "income" if row.amount > 0 else "expense"
+        category_id = self.exact[kind].get(row.category.lower()) if row.category else None
+        if category_id is None and row.description:
+            text = row.description.lower()
+            category_id = next((cid for needle, cid in self.contains[kind] if needle in text), None)
+        if category_id is None:
+            category_id = self.default[kind]
+        return category_id, self.types[category_id]
+
+
+def import_statement(
+    stream: BinaryIO,
+    db: Session,
+    user: models.User,
+    profile: models.StatementProfile,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    progress: Optional[Callable[[str, int], None]] = None,
+    should_cancel: Optional[Callable[[], bool]] = None,
+) -> Dict[str, int]:
+    """Importa un extracto a la wallet del perfil y devuelve contadores.
+
+    progress("rows", filas leídas) se llama tras cada lote confirmado; si
+    should_cancel() devuelve True se lanza ImportCancelled antes del siguiente
+    lote (los ya confirmados se conservan y una reimportación los omite).
+    """
+    report = progress or (lambda _table, _rows: None)
+    category_ids = {profile.income_category_id, profile.expense_category_id} | {r.category_id for r in profile.rules}
+    category_types = dict(
+        db.query(models.Category.id, models.Category.type).filter(
+            models.Category.user_id == user.id, models.Category.id.in_(category_ids)
+        )
+    )
+    if len(category_types) != len(category_ids):
+        raise StatementError("El perfil usa categorías que ya no existen")
+    resolver = CategoryResolver(profile, category_types)
+
+    user_id, wallet_id = user.id, profile.wallet_id
+    smap = SourceMap(db, user_id, f"statement:{profile.id}")
+    writer = TransactionBatchWriter(
+        db,
+        user_id,
+        batch_size=batch_size,
+        on_inserted=lambda tagged: smap.record(
+            "transactions", [SourceEntry(pk, new_id, h, delta) for (pk, h, delta), new_id in tagged]
+        ),
+    )
+    duplicates = 0
+    invalid = 0
+    read = 0
+    rows = iter_statement_rows(stream, profile)
+    while True:
+        if should_cancel is not None and should_cancel():
+            raise ImportCancelled()
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        valid = [r for r in batch if r is not None]
+        invalid += len(batch) - len(valid)
+        existing = smap.lookup("transactions", list({r.pk for r in valid}))
+        seen = set(existing)
+        for row in valid:
+            if row.pk in seen:
+                duplicates += 1
+                continue
+            seen.add(row.pk)
+            category_id, category_type = resolver.resolve(row)
+            amount = abs(row.amount)
+            values = {
+                "amount": amount,
+                "description": row.description,
+                "date": row.date,
+                "wallet_id": wallet_id,
+                "category_id": category_id,
+            }
+            delta = signed_amount(category_type, amount)
+            writer.add(
+                values,
+                category_type,
+                delta,
+                tag=(row.pk, row_hash(*(values[k] for k in sorted(values))), delta),
+            )
+        writer.finish()
+        bump_data_version(db, user_id)
+        db.commit()
+        read += len(batch)
+        report("rows", read)
+
+    return {
+        "transactions": writer.count,
+        "skipped_duplicate": duplicates,
+        "skipped_invalid": invalid,
+    }
@@ -1,15 +1,48 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from app.db import models
-from app.db.database import engine
+from sqlalchemy import inspect
+from app.db.database import async_engine, engine, ensure_indexes, SessionLocal
+from app.db.search import ensure_search_index
 from app.api.routes import users, wallets, categories, transactions
 from app.api.routes import auth
 from app.api.routes import imports as import_routes
 from app.api.routes import backup as backup_routes
-from app.api.routes import budgets, summary, api_keys
+from app.api.routes import budgets, summary, api_keys, admin, events
+from app.cache import get_response_cache
+from app.deps import principal_cache, NotModified
+from app.security import shutdown_hash_pool
+from app.services.import_jobs import import_jobs
+from app.services.ledger import backfill_wallet_checkpoints, rebuild_monthly_rollups
+from sqlalchemy.exc import IntegrityError
 
+# Si la tabla de rollups es nueva se llena una vez desde las transacciones existentes
+_rollups_existed = inspect(engine).has_table(models.MonthlyRollup.__tablename__)
 models.Base.metadata.create_all(bind=engine)
+if not _rollups_existed:
+    with SessionLocal() as _db:
+        rebuild_monthly_rollups(_db)
+        _db.commit()
+# Wallets anteriores a los checkpoints de saldo (o restauradas/copiadas sin ellos)
+with SessionLocal() as _db:
+    try:
+        backfill_wallet_checkpoints(_db)
+        _db.commit()
+    except IntegrityError:
+        # Otro worker que arrancó a la vez ya los creó
+        _db.rollback()
+ensure_indexes(models.Base.metadata)
+ensure_search_index(engine)
 
 app = FastAPI(title="API Finanzas Personales")
+app.add_event_handler("shutdown", shutdown_hash_pool)
+app.add_event_handler("shutdown", import_jobs.shutdown)
+if async_engine is not None:
+    app.add_event_handler("shutdown", async_engine.dispose)
+
+
+@app.exception_handler(NotModified)
+def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "private, no-cache"})
 
 # Rutas principales
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
@@ -25,8 +58,15 @@ from fastapi.responses import PlainTextResponse
 def read_status():
     return "its ok"
 
+
+@app.get("/status/cache", tags=["status"])
+def read_cache_status():
+    return {"principal": principal_cache.stats(), "responses": get_response_cache().stats()}
+
 # Import endpoints
 app.include_router(import_routes.router, prefix="/api/import", tags=["Import"])
 app.include_router(backup_routes.router, prefix="/api/backup", tags=["Backup"])
 app.include_router(budgets.router, prefix="/api/budgets", tags=["Budgets"])
 app.include_router(summary.router, prefix="/api/summary", tags=["Summary"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
@@ -0,0 +1,136 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from decimal import Decimal
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.db import models
+from app.services.importer import _d2, _to_date, import_external_sqlite
+
+
+def build_source(path: str, wallets: int, categories: int, transactions: int, seed: int = 7) -> None:
+    """Crea un SQLite con el esquema externo y datos sintéticos."""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE wallets (wallet_pk TEXT PRIMARY KEY, name TEXT, currency TEXT, date_created INTEGER);
+        CREATE TABLE categories (category_pk TEXT PRIMARY KEY, name TEXT, income INTEGER, date_created INTEGER);
+        CREATE TABLE transactions (
+            transaction_pk TEXT PRIMARY KEY, name TEXT, note TEXT, amount REAL,
+            category_fk TEXT, wallet_fk TEXT, date_created INTEGER, income INTEGER
+        );
+        """
+    )
+    start = 1_600_000_000
+    conn.executemany(
+        "INSERT INTO wallets VALUES (?, ?, ?, ?)",
+        [(f"w{i}", f"Wallet {i}", "COP", start + i) for i in range(wallets)],
+    )
+    conn.executemany(
+        "INSERT INTO categories VALUES (?, ?, ?, ?)",
+        [(f"c{i}", f"Categoria {i}", 1 if i % 4 == 0 else 0, start + i) for i in range(categories)],
+    )
+    rows = []
+    for i in range(transactions):
+        category = rnd.randrange(categories)
+        rows.append(
+            (
+                f"t{i}",
+                f"mov {i}",
+                "nota" if i % 3 == 0 else None,
+                round(rnd.uniform(1, 500), 2),
+                f"c{category}",
+                f"w{rnd.randrange(wallets)}",
+                start + i * 600,
+                1 if category % 4 == 0 else 0,
+            )
+        )
+    conn.executemany("INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def legacy_import(sqlite_path: str, db, user: models.User, default_currency: str = "COP") -> int:
+    """Implementación anterior (fila por fila) usada como referencia de la medición."""
+    src = create_engine(f"sqlite:///{sqlite_path}").connect()
+    wallet_map, category_map = {}, {}
+    for row in src.execute(text("SELECT wallet_pk, name, currency FROM wallets ORDER BY date_created")).mappings():
+        w = models.Wallet(name=row["name"], currency=row["currency"] or default_currency, balance=Decimal("0.00"), user_id=user.id)
+        db.add(w)
+        db.flush()
+        wallet_map[row["wallet_pk"]] = w.id
+    db.commit()
+    for row in src.execute(text("SELECT category_pk, name, income FROM categories ORDER BY date_created")).mappings():
+        c = models.Category(name=row["name"], type="income" if row["income"] == 1 else "expense", user_id=user.id)
+        db.add(c)
+        db.flush()
+        category_map[row["category_pk"]] = c.id
+    db.commit()
+    count = 0
+    for row in src.execute(
+        text("SELECT name, note, amount, category_fk, wallet_fk, date_created, income FROM transactions ORDER BY date_created")
+    ).mappings():
+        amount = _d2(row["amount"] or 0)
+        db.add(
+            models.Transaction(
+                amount=amount,
+                description=row["name"],
+                date=_to_date(row["date_created"]),
+                wallet_id=wallet_map[row["wallet_fk"]],
+                category_id=category_map[row["category_fk"]],
+                user_id=user.id,
+            )
+        )
+        w = db.query(models.Wallet).get(wallet_map[row["wallet_fk"]])
+        w.balance = _d2((w.balance or Decimal("0")) + (amount if row["income"] == 1 else -amount))
+        count += 1
+    db.commit()
+    src.close()
+    return count
+
+
+def run(label: str, fn, source: str, url: str | None) -> None:
+    tmpdir = tempfile.mkdtemp()
+    engine = create_engine(url or f"sqlite:///{os.path.join(tmpdir, 'dest.db')}")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+    try:
+        user = models.User(email=f"bench-{label}@example.com", name=label, password_hash="x")
+        db.add(user)
+        db.commit()
+        started = time.perf_counter()
+        result = fn(source, db, user)
+        elapsed = time.perf_counter() - started
+        count = result["transactions"] if isinstance(result, dict) else result
+        print(f"{label:>8}: {count} transactions in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s)")
+    finally:
+        db.close()
+        if url:
+            models.Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el rendimiento del importador de SQLite externo")
+    parser.add_argument("--transactions", type=int, default=50_000)
+    parser.add_argument("--wallets", type=int, default=5)
+    parser.add_argument("--categories", type=int, default=30)
+    parser.add_argument("--baseline", action="store_true", help="Mide también la implementación fila por fila")
+    parser.add_argument("--url", default=None, help="Base de datos destino VACÍA (por defecto SQLite temporal)")
+    args = parser.parse_args()
+
+    source = os.path.join(tempfile.mkdtemp(), "source.sqlite")
+    build_source(source, args.wallets, args.categories, args.transactions)
+    run("batched", import_external_sqlite, source, args.url)
+    if args.baseline:
+        run("legacy", legacy_import, source, args.url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+import argparse
+import inspect
+import json
+import re
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+
+from fastapi import Response
+from fastapi.params import Depends as DependsParam, Param
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db import models
+from app.api.routes import budgets, categories, summary, transactions, wallets, api_keys, backup
+from app.services.budget_progress import compute_budget_spent
+
+
+# Tablas que crecen con los datos del usuario: un scan completo sobre ellas es regresión
+TRACKED_TABLES = {
+    "transactions",
+    "wallets",
+    "categories",
+    "budgets",
+    "category_budget_limits",
+    "api_keys",
+}
+
+# Consultas que deben acotar transactions por fecha: buscar solo por user_id
+# recorre todo el historial del usuario
+DATE_RANGE_CASES = {"budgets.spent"}
+
+
+def call_route(fn, **kwargs):
+    """Llama una ruta como función normal resolviendo los defaults de Query()."""
+    for name, param in inspect.signature(fn).parameters.items():
+        if name in kwargs:
+            continue
+        default = param.default
+        if isinstance(default, DependsParam):
+            continue
+        if isinstance(default, Param):
+            kwargs[name] = default.default
+        elif default is not inspect.Parameter.empty:
+            kwargs[name] = default
+        elif name == "response":
+            kwargs[name] = Response()
+    return fn(**kwargs)
+
+
+def seed(db):
+    user = models.User(email="plan@example.com", name="plan", password_hash="x")
+    db.add(user)
+    db.flush()
+    w1 = models.Wallet(name="Cuenta", currency="COP", balance=0, user_id=user.id)
+    w2 = models.Wallet(name="Ahorro", currency="USD", balance=0, user_id=user.id)
+    c_in = models.Category(name="Salario", type="income", user_id=user.id)
+    c_out = models.Category(name="Comida", type="expense", user_id=user.id)
+    db.add_all([w1, w2, c_in, c_out])
+    db.flush()
+    start = date.today() - timedelta(days=90)
+    for i in range(200):
+        db.add(
+            models.Transaction(
+                amount=Decimal(10 + i),
+                description=f"mov {i}",
+                date=start + timedelta(days=i % 90) if i % 17 else None,
+                wallet_id=(w1 if i % 2 else w2).id,
+                category_id=(c_in if i % 5 == 0 else c_out).id,
+                user_id=user.id,
+            )
+        )
+    budget = models.Budget(
+        name="Mensual", period_start=start, period_end=date.today(), user_id=user.id, category_id=c_out.id
+    )
+    db.add(budget)
+    db.flush()
+    db.add(models.CategoryBudgetLimit(budget_id=budget.id, category_id=c_out.id, limit_amount=Decimal(500)))
+    db.add(models.APIKey(name="k", key_hash="h", user_id=user.id))
+    db.commit()
+    return user, w1, c_out, budget
+
+
+def spent_budgets(user, wallet, category):
+    """Presupuestos sin guardar que cubren cada rama de compute_budget_spent."""
+    today = date.today()
+    month = today.replace(day=1)
+    last_month_end = month - timedelta(days=1)
+    specs = [
+        (today - timedelta(days=20), today, category.id, None),  # rango parcial
+        (today - timedelta(days=20), None, None, wallet.id),  # sin fin
+        (None, today, category.id, None),  # sin inicio
+        (None, None, None, None),  # sin periodo: incluye las transacciones sin fecha
+        (last_month_end.replace(day=1), last_month_end, category.id, None),  # mes completo: rollups
+    ]
+    result = []
+    for i, (start, end, category_id, wallet_id) in enumerate(specs, start=1000):
+        b = models.Budget(
+            id=i, name=f"b{i}", period_start=start, period_end=end, category_id=category_id, wallet_id=wallet_id,
+            user_id=user.id,
+        )
+        b.limits = []
+        result.append(b)
+    return result
+
+
+def route_cases(db, user, wallet, category, budget):
+    """(nombre, callable, permitir_sort) para cada consulta de las rutas."""
+    cases = []
+    today = date.today()
+    filters = {
+        "all": {},
+        "wallet": {"wallet_id": wallet.id},
+        "category": {"category_id": category.id},
+        "wallet+category": {"wallet_id": wallet.id, "category_id": category.id},
+        "range": {"date_from": today - timedelta(days=30), "date_to": today},
+        "wallet+range": {"wallet_id": wallet.id, "date_from": today - timedelta(days=30)},
+    }
+    for label, flt in filters.items():
+        for order_by in ("date", "id", "amount"):
+            for order_dir in ("desc", "asc"):
+                # Solo el orden por fecha está indexado en combinación con filtros;
+                # id/amount con filtros ordena el subconjunto ya filtrado.
+                allow_sort = order_by != "date" and label != "all"
+                name = f"transactions.list[{label},{order_by},{order_dir}]"
+
+                def run(flt=flt, order_by=order_by, order_dir=order_dir):
+                    response = Response()
+                    call_route(
+                        transactions.list_transactions,
+                        response=response,
+                        db=db,
+                        current_user=user,
+                        order_by=order_by,
+                        order_dir=order_dir,
+                        limit=5,
+                        **flt,
+                    )
+                    cursor = response.headers.get("X-Next-Cursor")
+                    if cursor:
+                        call_route(
+                            transactions.list_transactions_detailed,
+                            db=db,
+                            current_user=user,
+                            order_by=order_by,
+                            order_dir=order_dir,
+                            limit=5,
+                            cursor=cursor,
+                            **flt,
+                        )
+
+                cases.append((name, run, allow_sort))
+
+        def export(flt=flt):
+            stmt = transactions._apply_filters(
+                select(models.Transaction.id), user.id, flt.get("wallet_id"), flt.get("category_id"),
+                flt.get("date_from"), flt.get("date_to"),
+            ).order_by(models.Transaction.date, models.Transaction.id)
+            db.execute(stmt).all()
+
+        cases.append((f"transactions.export[{label}]", export, label not in ("all", "range", "wallet", "wallet+range")))
+
+    cases += [
+        ("transactions.get", lambda: call_route(transactions.get_transaction, transaction_id=1, db=db, current_user=user), False),
+        ("wallets.list", lambda: call_route(wallets.list_wallets, db=db, current_user=user), False),
+        ("wallets.get", lambda: call_route(wallets.get_wallet, wallet_id=wallet.id, db=db, current_user=user), False),
+        ("categories.list", lambda: call_route(categories.list_categories, db=db, current_user=user), False),
+        ("categories.get", lambda: call_route(categories.get_category, category_id=category.id, db=db, current_user=user), False),
+        ("budgets.list", lambda: call_route(budgets.list_budgets, db=db, current_user=user), False),
+        ("budgets.get", lambda: call_route(budgets.get_budget, budget_id=budget.id, db=db, current_user=user), False),
+        ("summary", lambda: summary.build_summary(db, user), True),
+        ("budgets.spent", lambda: compute_budget_spent(db, user.id, spent_budgets(user, wallet, category)), True),
+        ("api_keys.list", lambda: call_route(api_keys.list_api_keys, db=db, current_user=user), False),
+        ("backup.export", lambda: call_route(backup.export_backup, db=db, current_user=user), False),
+    ]
+    return cases
+
+
+def explain_sqlite(conn, statement, parameters):
+    rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    return [row[-1] for row in rows]
+
+
+def sqlite_problems(plan, allow_sort, need_date=False):
+    problems = []
+    for line in plan:
+        m = re.match(r"SCAN (\w+)", line)
+        if m and m.group(1) in TRACKED_TABLES:
+            problems.append(f"full scan: {line}")
+        if need_date and line.startswith("SEARCH transactions") and "date" not in line.split("(", 1)[-1]:
+            problems.append(f"sin rango de fecha: {line}")
+        if "USE TEMP B-TREE FOR ORDER BY" in line and not allow_sort:
+            problems.append(f"sort sin índice: {line}")
+    return problems
+
+
+def explain_postgres(conn, statement, parameters):
+    if statement.lstrip().upper().startswith("SELECT"):
+        prefix = "EXPLAIN (ANALYZE, FORMAT JSON) "
+    else:
+        prefix = "EXPLAIN (FORMAT JSON) "
+    raw = conn.exec_driver_sql(prefix + statement, parameters).scalar()
+    return raw if isinstance(raw, list) else json.loads(raw)
+
+
+def postgres_problems(plan, allow_sort, need_date=False):
+    problems = []
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") in TRACKED_TABLES:
+            problems.append(f"full scan: {node['Relation Name']}")
+        index = node.get("Index Name") or ""
+        if need_date and index.startswith("ix_transactions_") and "date" not in node.get("Index Cond", ""):
+            problems.append(f"sin rango de fecha: {index} {node.get('Index Cond')}")
+        if node.get("Sort Space Type") == "Disk":
+            problems.append(f"sort a disco: {node.get('Sort Key')}")
+        if node.get("Node Type") == "Sort" and not allow_sort:
+            problems.append(f"sort sin índice: {node.get('Sort Key')}")
+        for child in node.get("Plans", []):
+            walk(child)
+
+    for entry in plan:
+        walk(entry["Plan"])
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Ejecuta EXPLAIN sobre las consultas de cada ruta y falla ante scans completos o sorts sin índice"
+    )
+    parser.add_argument(
+        "--url",
+        default="sqlite://",
+        help="Base de datos VACÍA de prueba (por defecto SQLite en memoria). Se crean y borran las tablas.",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Imprime el plan de cada consulta")
+    args = parser.parse_args()
+
+    if args.url.startswith("sqlite"):
+        engine = create_engine(args.url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    else:
+        engine = create_engine(args.url)
+    dialect = engine.dialect.name
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine, autoflush=False, autocommit=False)()
+
+    failures = 0
+    try:
+        user, wallet, category, budget = seed(db)
+        if dialect == "postgresql":
+            db.execute(text("ANALYZE"))
+            # Con tablas pequeñas el planner prefiere seq scan; se fuerza a mostrar
+            # si existe un índice utilizable
+            db.execute(text("SET enable_seqscan = off"))
+
+        for name, run, allow_sort in route_cases(db, user, wallet, category, budget):
+            captured = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if not executemany and statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+                    captured.append((statement, parameters))
+
+            event.listen(engine, "before_cursor_execute", capture)
+            try:
+                run()
+            finally:
+                event.remove(engine, "before_cursor_execute", capture)
+
+            conn = db.connection()
+            for statement, parameters in captured:
+                if dialect == "sqlite":
+                    plan = explain_sqlite(conn, statement, parameters)
+                    problems = sqlite_problems(plan, allow_sort, name in DATE_RANGE_CASES)
+                elif dialect == "postgresql":
+                    plan = explain_postgres(conn, statement, parameters)
+                    problems = postgres_problems(plan, allow_sort, name in DATE_RANGE_CASES)
+                else:
+                    raise SystemExit(f"Dialecto no soportado: {dialect}")
+                if args.verbose or problems:
+                    print(f"[{name}] {' '.join(statement.split())[:200]}")
+                    if args.verbose:
+                        print(f"    plan: {plan}")
+                for problem in problems:
+                    print(f"    FAIL {problem}")
+                    failures += 1
+    finally:
+        db.rollback()
+        db.close()
+        models.Base.metadata.drop_all(bind=engine)
+
+    if failures:
+        print(f"{failures} problemas de plan de consulta")
+        sys.exit(1)
+    print("Planes de consulta OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,106 @@
 import argparse
-from typing import Type, List, Dict, Any
+import csv
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Type, List, Sequence
 
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, MetaData, Table, and_, create_engine, exists, insert, select, text
+from sqlalchemy.engine import Connection, Engine
 
 from app.db import models
 from app.db.database import engine as dest_engine, SessionLocal as DestSession
+from app.services.ledger import backfill_wallet_checkpoints, rebuild_monthly_rollups
+
+
+# Orden de copia: cada nivel depende (por FK) solo de los anteriores, así que
+# las tablas de un mismo nivel se copian en paralelo.
+COPY_LEVELS = [
+    [(models.User, ["email"])],  # email unique
+    [(models.Wallet, None), (models.Category, None)],
+    [(models.Transaction, None)],
+]
+
+_COPY_NULL = "\\N"
+
+
+def _copy_rows(conn: Connection, table: Table, rows: Sequence[tuple]) -> None:
+    """Inserta rows (tuplas en el orden de table.columns) con COPY en Postgres o executemany."""
+    if conn.dialect.name == "postgresql":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            writer.writerow([_COPY_NULL if v is None else v for v in row])
+        buf.seek(0)
+        prep = conn.dialect.identifier_preparer
+        columns = ", ".join(prep.quote(c.name) for c in table.columns)
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {prep.format_table(table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{_COPY_NULL}')",
+                buf,
+            )
+        finally:
+            cursor.close()
+        return
+    keys = [c.key for c in table.columns]
+    conn.execute(insert(table), [dict(zip(keys, row)) for row in rows])
+
+
+def _staging_table(conn: Connection, table: Table) -> Table:
+    stage = Table(
+        f"_stage_{table.name}",
+        MetaData(),
+        *[Column(c.name, c.type) for c in table.columns],
+        prefixes=["TEMPORARY"],
+    )
+    stage.create(conn)
+    return stage
 
 
 def copy_table(
-    src_session,
-    dest_session,
+    src_engine: Engine,
+    dest: Engine,
     model: Type,
     unique_fields: List[str] | None = None,
+    batch_size: int = 10_000,
     verbose: bool = True,
-):
-    unique_fields = unique_fields or []
-    rows = src_session.query(model).all()
+) -> int:
+    """Copia una tabla por lotes (yield_per) conservando los ids, en una transacción.
+
+    Con unique_fields, cada lote pasa por una tabla temporal y se inserta con un
+    único INSERT ... SELECT que descarta (anti-join) las filas que ya existen.
+    """
+    table = model.__table__
+    started = time.perf_counter()
     count = 0
-    for row in rows:
-        data: Dict[str, Any] = {}
-        for c in model.__table__.columns:
-            data[c.name] = getattr(row, c.name)
-
-        # Skip if exists by unique fields
-        if unique_fields:
-            q = dest_session.query(model)
-            for f in unique_fields:
-                q = q.filter(getattr(model, f) == data.get(f))
-            if q.first():
+    with src_engine.connect() as src, dest.begin() as conn:
+        stage = _staging_table(conn, table) if unique_fields else None
+        result = src.execution_options(yield_per=batch_size).execute(select(table))
+        for batch in result.partitions():
+            rows = [tuple(row) for row in batch]
+            if stage is None:
+                _copy_rows(conn, table, rows)
+                count += len(rows)
                 continue
+            _copy_rows(conn, stage, rows)
+            missing = ~exists().where(and_(*[table.c[f] == stage.c[f] for f in unique_fields]))
+            inserted = conn.execute(
+                insert(table).from_select(
+                    [c.name for c in table.columns],
+                    select(*stage.columns).where(missing),
+                )
+            )
+            count += inserted.rowcount
+            conn.execute(stage.delete())
+        if stage is not None:
+            stage.drop(conn)
 
-        # Insert preserving IDs
-        obj = model(**data)
-        dest_session.add(obj)
-        count += 1
-
-    dest_session.commit()
     if verbose:
-        print(f"Copied {count} rows into {model.__tablename__}")
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else 0.0
+        print(f"Copied {count} rows into {model.__tablename__} in {elapsed:.1f}s ({rate:,.0f} rows/s)")
+    return count
 
 
 def bump_postgres_sequences(dest_session):
@@ -66,27 +128,41 @@ def bump_postgres_sequences(dest_session):
 def main():
     parser = argparse.ArgumentParser(description="Import data from a SQLite file to current DB")
     parser.add_argument("sqlite_path", help="Path to the .sqlite/.db file (e.g., ./finanzas.db)")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Rows read and written per batch")
+    parser.add_argument("--workers", type=int, default=4, help="Tables copied in parallel (SQLite destination: 1)")
     args = parser.parse_args()
 
     src_engine = create_engine(f"sqlite:///{args.sqlite_path}", connect_args={"check_same_thread": False})
-    SrcSession = sessionmaker(bind=src_engine, autoflush=False, autocommit=False)
-    src_session = SrcSession()
+    # SQLite admite un solo escritor: en ese caso las tablas se copian una a una
+    workers = 1 if dest_engine.dialect.name == "sqlite" else max(1, args.workers)
     dest_session = DestSession()
 
     try:
-        # Order matters due to FKs
-        copy_table(src_session, dest_session, models.User, unique_fields=["email"])  # email unique
-        copy_table(src_session, dest_session, models.Wallet)
-        copy_table(src_session, dest_session, models.Category)
-        copy_table(src_session, dest_session, models.Transaction)
+        started = time.perf_counter()
+        total = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for level in COPY_LEVELS:
+                futures = [
+                    pool.submit(copy_table, src_engine, dest_engine, model, unique, args.batch_size)
+                    for model, unique in level
+                ]
+                total += sum(f.result() for f in futures)
+        elapsed = time.perf_counter() - started
+        print(f"Copied {total} rows in {elapsed:.1f}s ({total / elapsed if elapsed > 0 else 0:,.0f} rows/s)")
+
+        # Rollups y checkpoints de saldo se recalculan desde las transacciones
+        # copiadas; la apertura de cada wallet es su balance menos sus transacciones
+        rebuilt = rebuild_monthly_rollups(dest_session)
+        wallets = backfill_wallet_checkpoints(dest_session)
+        dest_session.commit()
+        print(f"Rebuilt {rebuilt} monthly rollup rows and balance checkpoints for {wallets} wallets")
 
         bump_postgres_sequences(dest_session)
         print("Import completed successfully.")
     finally:
-        src_session.close()
         dest_session.close()
+        src_engine.dispose()
 
 
 if __name__ == "__main__":
     main()
-
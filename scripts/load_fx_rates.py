@@ -0,0 +1,77 @@
+import argparse
+import csv
+from datetime import date
+from decimal import Decimal
+
+from sqlalchemy import insert, update
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.db.dialect import upsert_insert
+from app.services.fx import FX_PIVOT
+
+
+BATCH_SIZE = 1000
+
+
+def read_rates(path: str):
+    """CSV con columnas date,currency,rate (rate = unidades de currency por 1 de la moneda pivote)."""
+    with open(path, newline="", encoding="utf-8") as fh:
+        for row in csv.DictReader(fh):
+            yield {
+                "currency": row["currency"].strip().upper(),
+                "date": date.fromisoformat(row["date"].strip()),
+                "units_per_pivot": Decimal(row["rate"].strip()),
+            }
+
+
+def upsert_rates(db, rows) -> None:
+    table = models.FxRate
+    stmt = upsert_insert(db, table)
+    if stmt is not None:
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.currency, table.date],
+                set_={"units_per_pivot": stmt.excluded.units_per_pivot},
+            ),
+            rows,
+        )
+        return
+    for row in rows:
+        result = db.execute(
+            update(table)
+            .where(table.currency == row["currency"], table.date == row["date"])
+            .values(units_per_pivot=row["units_per_pivot"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(table), [row])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Carga tasas de cambio desde un archivo local (unidades por 1 {FX_PIVOT})"
+    )
+    parser.add_argument("path", help="CSV con columnas date,currency,rate")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    total = 0
+    try:
+        batch = []
+        for row in read_rates(args.path):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                upsert_rates(db, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            upsert_rates(db, batch)
+            total += len(batch)
+        db.commit()
+        print(f"Loaded {total} FX rates")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
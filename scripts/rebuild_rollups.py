@@ -0,0 +1,29 @@
+import argparse
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.services.ledger import rebuild_monthly_rollups
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula desde cero la tabla monthly_rollups")
+    parser.add_argument("--email", default=None, help="Solo el usuario con este email (por defecto todos)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user_id = None
+        if args.email:
+            user = db.query(models.User).filter(models.User.email == args.email).first()
+            if not user:
+                raise SystemExit(f"Usuario no encontrado: {args.email}")
+            user_id = user.id
+        rows = rebuild_monthly_rollups(db, user_id)
+        db.commit()
+        print(f"Rebuilt {rows} monthly rollup rows")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import argparse
+
+from app.db import models
+from app.db.database import SessionLocal
+from app.services.reconcile import reconcile_balances
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recalcula el balance de cada wallet desde sus transacciones y reporta (o corrige) diferencias"
+    )
+    parser.add_argument("--email", default=None, help="Solo el usuario con este email (por defecto todos)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Usuarios por consulta agrupada")
+    parser.add_argument("--fix", action="store_true", help="Corrige los balances con diferencias")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        user_ids = None
+        if args.email:
+            user = db.query(models.User).filter(models.User.email == args.email).first()
+            if not user:
+                raise SystemExit(f"Usuario no encontrado: {args.email}")
+            user_ids = [user.id]
+        result = reconcile_balances(db, user_ids=user_ids, batch_size=args.batch_size, fix=args.fix)
+        for d in result.drifted:
+            print(f"wallet {d.wallet_id} (user {d.user_id}): stored {d.stored} expected {d.expected} drift {d.drift}")
+        if result.without_opening:
+            action = "opening recorded" if args.fix else "skipped, run with --fix to record their opening"
+            print(f"Wallets without opening balance ({action}): {', '.join(map(str, result.without_opening))}")
+        print(
+            f"Users: {result.users_checked}, wallets: {result.wallets_checked}, "
+            f"drifted: {len(result.drifted)}, fixed: {result.fixed}"
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()